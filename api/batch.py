@@ -0,0 +1,178 @@
+import io
+import os
+import zipfile
+from api.cache import file_digest, make_key
+from api.instrument import stage
+from api.lazy import LazyModule
+from api.parallel import run_parallel
+from api import store
+from api.readers import EXCEL_EXTENSIONS
+from api.utils import LEVELS, SCORING_VERSION, process_dataframe
+from api.workbook import WORKBOOK_METRICS, WORKBOOK_VERSION, build_workbook
+
+pd = LazyModule("pandas")
+
+# --- ПАКЕТНАЯ ОБРАБОТКА ---
+# На вход - несколько файлов или ZIP-архив с ними, на выходе - ZIP с отчетом
+# *_results.xlsx на каждый файл и сводной книгой по всем файлам.
+
+TABLE_EXTENSIONS = EXCEL_EXTENSIONS | {".csv", ".txt"}
+SUMMARY_NAME = "Сводка.xlsx"
+BATCH_FILENAME = "batch_results.zip"
+
+# Ограничения на распаковку архива (защита от zip-бомб)
+MAX_ARCHIVE_MEMBERS = 500
+MAX_ARCHIVE_BYTES = 256 * 1024 * 1024
+
+class NamedBytesIO(io.BytesIO):
+    """BytesIO с именем файла - заменяет FileStorage внутри процессов пула"""
+
+    def __init__(self, data, filename):
+        super().__init__(data)
+        self.filename = filename
+
+def is_archive(data, filename):
+    """ZIP-архив с таблицами (а не xlsx, который тоже является zip-файлом)"""
+    if not data.startswith(b"PK"):
+        return False
+    if os.path.splitext(filename or "")[1].lower() == ".zip":
+        return True
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            return "[Content_Types].xml" not in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+def extract_archive(data):
+    """Список (имя, байты) таблиц из архива; служебные файлы и папки пропускаются"""
+    items = []
+    total = 0
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Поврежденный ZIP-архив")
+    with zf:
+        for info in zf.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            if info.is_dir() or not base or base.startswith((".", "~$")) or name.startswith("__MACOSX/"):
+                continue
+            if os.path.splitext(base)[1].lower() not in TABLE_EXTENSIONS:
+                continue
+            total += info.file_size
+            if len(items) >= MAX_ARCHIVE_MEMBERS or total > MAX_ARCHIVE_BYTES:
+                raise ValueError("Слишком большой архив")
+            items.append((base, zf.read(info)))
+    return items
+
+def collect_uploads(files):
+    """Разворачивает загруженные файлы (и архивы среди них) в список (имя, байты)"""
+    items = []
+    for f in files:
+        data = f.read()
+        if is_archive(data, f.filename):
+            items.extend(extract_archive(data))
+        else:
+            items.append((f.filename or "file", data))
+    return items
+
+def report_name(filename, taken):
+    """Уникальное имя отчета <имя файла>_results.xlsx внутри архива"""
+    stem = os.path.splitext(os.path.basename(filename))[0] or "file"
+    name = f"{stem}_results.xlsx"
+    n = 2
+    while name in taken:
+        name = f"{stem}_{n}_results.xlsx"
+        n += 1
+    taken.add(name)
+    return name
+
+def summary_row(filename, df):
+    """Строка сводки: число детей и распределение уровней по показателям"""
+    row = {"Файл": filename, "Детей": len(df)}
+    for metric in WORKBOOK_METRICS:
+        counts = df[f"{metric}_уровень"].value_counts()
+        for level in LEVELS:
+            row[f"{metric}: {level}"] = int(counts.get(level, 0))
+    row["Ошибка"] = ""
+    return row
+
+def process_item(item):
+    """
+    Обрабатывает один файл пакета (выполняется в процессе пула).
+    Возвращает (имя файла, байты xlsx или None, строка сводки).
+    """
+    filename, data = item
+    try:
+        upload = NamedBytesIO(data, filename)
+        df = process_dataframe(upload)
+        if store.enabled():
+            store.save_upload(upload, df)
+        output = io.BytesIO()
+        build_workbook(df, output)
+        return filename, output.getvalue(), summary_row(filename, df)
+    except Exception as e:
+        return filename, None, {"Файл": filename, "Детей": 0, "Ошибка": str(e)}
+
+def save_uploads(files):
+    """
+    Сохраняет файлы пакета в хранилище без отчетов - когда архив отдан из кэша.
+    Файлы с ошибками пропускаются, как и при обработке.
+    """
+    for filename, data in collect_uploads(files):
+        try:
+            store.save_file(NamedBytesIO(data, filename))
+        except Exception:
+            pass
+
+def build_summary(rows, output):
+    """Сводная книга по всем файлам пакета с итоговой строкой"""
+    summary = pd.DataFrame(rows)
+    columns = ["Файл", "Детей"] + [f"{m}: {l}" for m in WORKBOOK_METRICS for l in LEVELS] + ["Ошибка"]
+    summary = summary.reindex(columns=columns)
+    counts = columns[1:-1]
+    summary[counts] = summary[counts].fillna(0).astype(int)
+    summary["Ошибка"] = summary["Ошибка"].fillna("")
+    total = {"Файл": "Итого", "Ошибка": ""}
+    total.update(summary[counts].sum().to_dict())
+    summary = pd.concat([summary, pd.DataFrame([total])], ignore_index=True)
+
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        summary.to_excel(writer, sheet_name="Сводка", index=False)
+        ws = writer.sheets["Сводка"]
+        ws.set_column(0, 0, 30)
+        ws.set_column(1, len(columns) - 2, 14)
+        ws.set_column(len(columns) - 1, len(columns) - 1, 40)
+        ws.freeze_panes(1, 1)
+
+def build_batch_zip(results, output):
+    """Пишет ZIP: отчет на каждый успешно обработанный файл и сводную книгу"""
+    taken = {SUMMARY_NAME}
+    # xlsx уже сжат внутри - повторно не упаковываем (ZIP_STORED)
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zf:
+        for filename, data, _ in results:
+            if data is not None:
+                zf.writestr(report_name(filename, taken), data)
+        summary = io.BytesIO()
+        build_summary([row for _, _, row in results], summary)
+        zf.writestr(SUMMARY_NAME, summary.getvalue())
+
+def report_key(files):
+    """Ключ кэша архива: имена и хэши всех файлов пакета"""
+    parts = [f"{f.filename}:{file_digest(f)}" for f in files]
+    return make_key("batch", WORKBOOK_VERSION, SCORING_VERSION, *parts)
+
+def build_report(files, output, progress=None):
+    """Раскрывает архивы, считает файлы в пуле процессов и пишет итоговый ZIP в output"""
+    items = collect_uploads(files)
+    if not items:
+        raise ValueError("В архиве нет таблиц Excel или CSV")
+
+    def on_item(done, total):
+        if progress: progress(0.05 + 0.85 * done / total, f"Обработано файлов: {done} из {total}")
+
+    with stage("files"):
+        results = run_parallel(process_item, items, progress=on_item)
+    if progress: progress(0.9, "Формирование архива")
+    with stage("zip"):
+        build_batch_zip(results, output)
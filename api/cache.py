@@ -0,0 +1,211 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# --- КЭШ ОБРАБОТАННЫХ ДАННЫХ ---
+# Ключ - хэш содержимого загруженного файла (плюс версия расчетов),
+# поэтому повторная загрузка того же файла не парсится и не пересчитывается.
+
+CHUNK_SIZE = 1024 * 1024
+
+def file_digest(stream):
+    """
+    SHA-256 всего содержимого потока или загрузки (читается кусками с начала,
+    где бы ни стояла позиция), позиция потока возвращается на место
+    """
+    stream = getattr(stream, "stream", stream)
+    pos = stream.tell()
+    stream.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+    stream.seek(pos)
+    return h.hexdigest()
+
+def make_key(*parts):
+    """Собирает ключ кэша из частей (хэши файлов, версии, варианты)"""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """
+    Кэш в памяти с вытеснением давно не использованных записей.
+    Ограничен числом записей и суммарным размером; если задан disk_dir,
+    записи дублируются на диск (pickle) и переживают перезапуск процесса.
+    """
+
+    def __init__(self, max_items=8, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes or max_bytes * 4
+        self._items = OrderedDict()   # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                return item[0]
+        value = self._load(key)
+        if value is not None:
+            self._remember(key, value, _sizeof(value))
+        return value
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        self._remember(key, value, size)
+        self._dump(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def _remember(self, key, value, size):
+        # Слишком большой объект только вытеснил бы все остальное
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while self._items and (len(self._items) > self.max_items or self._size > self.max_bytes):
+                _, (_, old_size) = self._items.popitem(last=False)
+                self._size -= old_size
+
+    # --- Дисковый уровень ---
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + ".pkl")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        # Время доступа используется для вытеснения
+        os.utime(path)
+        return value
+
+    def _dump(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            # Диск - только ускорение: ошибка записи не должна ронять запрос
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        evict_dir(self.disk_dir, self.disk_max_bytes)
+
+class ArtifactCache:
+    """
+    Дисковый кэш готовых файлов отчетов (xlsx/docx). Ключ - хэш входных файлов,
+    эндпоинта и варианта отчета; он же отдается клиенту как ETag.
+    При превышении лимита удаляются файлы, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Путь к сохраненному артефакту или None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Сохраняет артефакт (bytes или файловый объект, читается с текущей позиции)"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, CHUNK_SIZE)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        evict_dir(self.directory, self.max_bytes)
+
+def evict_dir(path, max_bytes):
+    """Удаляет самые старые файлы каталога, пока суммарный размер больше max_bytes"""
+    entries = []
+    for entry in os.scandir(path):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, file_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        total -= size
+
+def _sizeof(value):
+    """Оценка размера объекта в памяти (для DataFrame - с учетом строк)"""
+    memory_usage = getattr(value, "memory_usage", None)
+    if memory_usage is not None:
+        return int(memory_usage(index=True, deep=True).sum())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+def env_int(name, default):
+    """Целое число из переменной окружения или default"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+# Общий кэш обработанных таблиц (см. utils.process_dataframe)
+FRAME_CACHE = LRUCache(
+    max_items=env_int("KIDSKI_FRAME_CACHE_ITEMS", 8),
+    max_bytes=env_int("KIDSKI_FRAME_CACHE_MB", 256) * 1024 * 1024,
+    disk_dir=os.environ.get("KIDSKI_FRAME_CACHE_DIR") or None,
+)
+
+# Кэш готовых отчетов /api/process и /api/compare (KIDSKI_ARTIFACT_CACHE_MB=0 - выключен)
+ARTIFACT_CACHE = ArtifactCache(
+    directory=os.environ.get("KIDSKI_ARTIFACT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "kidski-artifacts"),
+    max_bytes=env_int("KIDSKI_ARTIFACT_CACHE_MB", 512) * 1024 * 1024,
+)
@@ -0,0 +1,217 @@
+import io
+import threading
+from xml.sax.saxutils import escape, quoteattr
+from api.utils import LEVELS
+
+# matplotlib, python-docx и xlsxwriter импортируются внутри функций:
+# при старте функции /api/compare они не нужны
+
+# --- ГРАФИКИ ДЛЯ WORD-ОТЧЕТОВ ---
+
+LEVEL_LABELS = ["Ниже нормы", "Норма", "Выше нормы"]
+START_COLOR = "#a6cee3"   # Начало года
+END_COLOR = "#1f78b4"     # Конец года
+
+# Форматы вывода графиков в отчете: картинка matplotlib или родной график Word
+CHART_FORMATS = ("png", "native")
+
+def level_percentages(df, col_name):
+    """Доли уровней (в %) в колонке, в порядке LEVELS"""
+    if col_name not in df.columns:
+        return [0.0, 0.0, 0.0]
+    total = len(df)
+    counts = df[col_name].value_counts().reindex(LEVELS, fill_value=0)
+    if total == 0:
+        return [float(v) for v in counts]
+    return [float(v) for v in (counts / total * 100).fillna(0)]
+
+# --- Картинки (matplotlib без pyplot) ---
+# pyplot хранит фигуры в глобальном менеджере и не потокобезопасен. Здесь фигура
+# строится через объектный API (Figure + холст Agg) один раз на поток, а для
+# каждого показателя меняются только высоты столбцов, подписи и заголовок.
+
+class BarChartRenderer:
+    """Шаблон гистограммы «Начало / Конец года» по трем уровням"""
+
+    BAR_WIDTH = 0.35
+
+    def __init__(self, colors=(START_COLOR, END_COLOR), categories=LEVEL_LABELS):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=(6.5, 4))
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+        x = range(len(categories))
+        n = len(colors)
+        self.bars = []
+        for k, color in enumerate(colors):
+            offset = (k - (n - 1) / 2) * self.BAR_WIDTH
+            self.bars.append(ax.bar([i + offset for i in x], [0] * len(categories), self.BAR_WIDTH,
+                                    label=f"series{k}", color=color, edgecolor='white'))
+        # Подписи значений: по одной на столбец, текст задается при отрисовке
+        self.labels = [
+            [ax.text(bar.get_x() + bar.get_width() / 2, 0, "", ha='center', va='bottom', fontsize=9) for bar in bars]
+            for bars in self.bars
+        ]
+        ax.set_ylabel('Доля детей (%)')
+        self.title = ax.set_title(" ", pad=15)
+        ax.set_xticks(list(x))
+        ax.set_xticklabels(categories)
+        self.legend = ax.legend()
+        ax.grid(axis='y', linestyle='--', alpha=0.3)
+        ax.set_ylim(0, 105)
+        self.fig.tight_layout()
+
+    def render(self, title, series, dpi=150):
+        """series - [(подпись в легенде, значения в %)]; возвращает PNG в BytesIO"""
+        self.title.set_text(title)
+        for bars, labels, legend_text, (label, values) in zip(self.bars, self.labels, self.legend.get_texts(), series):
+            legend_text.set_text(label)
+            for bar, text, h in zip(bars, labels, values):
+                bar.set_height(h)
+                text.set_y(h + 1)
+                text.set_text(f'{h:.1f}%' if h > 0 else "")
+        img_stream = io.BytesIO()
+        self.fig.savefig(img_stream, format='png', dpi=dpi)
+        img_stream.seek(0)
+        return img_stream
+
+_local = threading.local()
+
+def render_bar_chart(title, series):
+    """PNG гистограммы уровней; шаблон фигуры свой у каждого потока"""
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = _local.renderer = BarChartRenderer()
+    return renderer.render(title, series)
+
+# --- Родные графики Word (DrawingML chart) ---
+# Вместо PNG в docx кладется часть chartN.xml с данными и встроенная
+# книга Excel с той же таблицей, поэтому график можно править в Word.
+
+CHART_URI = "http://schemas.openxmlformats.org/drawingml/2006/chart"
+CHART_ASPECT = 4 / 6.5   # пропорции как у картинки matplotlib (6.5 x 4 дюйма)
+# Подписи столбцов: нулевые доли не подписываем, как и на картинке
+LABEL_FORMAT = quoteattr('0.0"%";-0.0"%";')
+
+def _col(i):
+    return "ABCDEFGHIJ"[i]
+
+def _str_cache(values):
+    pts = "".join(f'<c:pt idx="{i}"><c:v>{escape(str(v))}</c:v></c:pt>' for i, v in enumerate(values))
+    return f'<c:strCache><c:ptCount val="{len(values)}"/>{pts}</c:strCache>'
+
+def _num_cache(values):
+    pts = "".join(f'<c:pt idx="{i}"><c:v>{float(v):.4f}</c:v></c:pt>' for i, v in enumerate(values))
+    return f'<c:numCache><c:formatCode>General</c:formatCode><c:ptCount val="{len(values)}"/>{pts}</c:numCache>'
+
+def _rich(text, size=None):
+    size_attr = f' sz="{size}"' if size else ""
+    return (f'<c:tx><c:rich><a:bodyPr/><a:p><a:pPr><a:defRPr{size_attr} b="0"/></a:pPr>'
+            f'<a:r><a:rPr lang="ru-RU"{size_attr} b="0"/><a:t>{escape(text)}</a:t></a:r></a:p></c:rich></c:tx>')
+
+def chart_xml(title, categories, series, y_title="Доля детей (%)", y_max=105):
+    """XML части графика: сгруппированная гистограмма, series - [(подпись, значения, цвет)]"""
+    from docx.oxml.ns import nsdecls
+
+    n = len(categories)
+    sers = []
+    for i, (label, values, color) in enumerate(series):
+        col = _col(i + 1)
+        sers.append(
+            f'<c:ser><c:idx val="{i}"/><c:order val="{i}"/>'
+            f'<c:tx><c:strRef><c:f>Sheet1!${col}$1</c:f>{_str_cache([label])}</c:strRef></c:tx>'
+            f'<c:spPr><a:solidFill><a:srgbClr val="{color.lstrip("#").upper()}"/></a:solidFill>'
+            f'<a:ln><a:solidFill><a:srgbClr val="FFFFFF"/></a:solidFill></a:ln></c:spPr>'
+            f'<c:invertIfNegative val="0"/>'
+            f'<c:dLbls><c:numFmt formatCode={LABEL_FORMAT} sourceLinked="0"/>'
+            f'<c:spPr><a:noFill/><a:ln><a:noFill/></a:ln></c:spPr>'
+            f'<c:txPr><a:bodyPr/><a:p><a:pPr><a:defRPr sz="900"/></a:pPr><a:endParaRPr lang="ru-RU"/></a:p></c:txPr>'
+            f'<c:dLblPos val="outEnd"/><c:showLegendKey val="0"/><c:showVal val="1"/><c:showCatName val="0"/>'
+            f'<c:showSerName val="0"/><c:showPercent val="0"/><c:showBubbleSize val="0"/></c:dLbls>'
+            f'<c:cat><c:strRef><c:f>Sheet1!$A$2:$A${n + 1}</c:f>{_str_cache(categories)}</c:strRef></c:cat>'
+            f'<c:val><c:numRef><c:f>Sheet1!${col}$2:${col}${n + 1}</c:f>{_num_cache(values)}</c:numRef></c:val>'
+            f'</c:ser>'
+        )
+    return (
+        f'<c:chartSpace {nsdecls("c", "a", "r")}>'
+        f'<c:roundedCorners val="0"/>'
+        f'<c:chart>'
+        f'<c:title>{_rich(title, 1400)}<c:overlay val="0"/></c:title>'
+        f'<c:autoTitleDeleted val="0"/>'
+        f'<c:plotArea><c:layout/>'
+        f'<c:barChart><c:barDir val="col"/><c:grouping val="clustered"/><c:varyColors val="0"/>'
+        f'{"".join(sers)}'
+        f'<c:gapWidth val="100"/><c:axId val="5001"/><c:axId val="5002"/></c:barChart>'
+        f'<c:catAx><c:axId val="5001"/><c:scaling><c:orientation val="minMax"/></c:scaling>'
+        f'<c:delete val="0"/><c:axPos val="b"/><c:numFmt formatCode="General" sourceLinked="0"/>'
+        f'<c:majorTickMark val="none"/><c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>'
+        f'<c:crossAx val="5002"/><c:crosses val="autoZero"/><c:auto val="1"/><c:lblAlgn val="ctr"/>'
+        f'<c:lblOffset val="100"/><c:noMultiLvlLbl val="0"/></c:catAx>'
+        f'<c:valAx><c:axId val="5002"/><c:scaling><c:orientation val="minMax"/>'
+        f'<c:max val="{y_max}"/><c:min val="0"/></c:scaling>'
+        f'<c:delete val="0"/><c:axPos val="l"/>'
+        f'<c:majorGridlines><c:spPr><a:ln w="6350"><a:solidFill><a:srgbClr val="D9D9D9"/></a:solidFill>'
+        f'<a:prstDash val="dash"/></a:ln></c:spPr></c:majorGridlines>'
+        f'<c:title>{_rich(y_title, 1000)}<c:overlay val="0"/></c:title>'
+        f'<c:numFmt formatCode="General" sourceLinked="0"/><c:majorTickMark val="out"/>'
+        f'<c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/><c:crossAx val="5001"/>'
+        f'<c:crosses val="autoZero"/><c:crossBetween val="between"/></c:valAx>'
+        f'</c:plotArea>'
+        f'<c:legend><c:legendPos val="t"/><c:overlay val="0"/></c:legend>'
+        f'<c:plotVisOnly val="1"/><c:dispBlanksAs val="gap"/>'
+        f'</c:chart>'
+        f'<c:externalData r:id="rId1"><c:autoUpdate val="0"/></c:externalData>'
+        f'</c:chartSpace>'
+    )
+
+def chart_workbook(categories, series):
+    """Встроенная книга Excel с таблицей данных графика (Word открывает ее по «Изменить данные»)"""
+    import xlsxwriter
+
+    buf = io.BytesIO()
+    wb = xlsxwriter.Workbook(buf, {"in_memory": True})
+    ws = wb.add_worksheet("Sheet1")
+    ws.write_column(1, 0, categories)
+    for i, (label, values, _) in enumerate(series):
+        ws.write(0, i + 1, label)
+        ws.write_column(1, i + 1, [round(float(v), 4) for v in values])
+    ws.set_column(0, 0, 16)
+    wb.close()
+    return buf.getvalue()
+
+def add_native_chart(doc, title, series, width, categories=LEVEL_LABELS):
+    """Добавляет в документ родной график Word (новым абзацем)"""
+    from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+    from docx.opc.part import Part
+    from docx.oxml import OxmlElement, parse_xml
+    from docx.oxml.ns import nsdecls
+
+    package = doc.part.package
+    chart_part = Part(
+        package.next_partname("/word/charts/chart%d.xml"), CT.DML_CHART,
+        chart_xml(title, categories, series).encode("utf-8"), package,
+    )
+    xlsx_part = Part(
+        package.next_partname("/word/embeddings/Microsoft_Excel_Sheet%d.xlsx"), CT.SML_SHEET,
+        chart_workbook(categories, series), package,
+    )
+    # В chart_xml на встроенную книгу ссылается rId1
+    chart_part.rels.get_or_add(RT.PACKAGE, xlsx_part)
+    r_id = doc.part.relate_to(chart_part, RT.CHART)
+
+    cx = int(width)
+    cy = int(width * CHART_ASPECT)
+    shape_id = doc.part.next_id
+    inline = parse_xml(
+        f'<wp:inline distT="0" distB="0" distL="0" distR="0" {nsdecls("wp", "a", "c", "r")}>'
+        f'<wp:extent cx="{cx}" cy="{cy}"/><wp:effectExtent l="0" t="0" r="0" b="0"/>'
+        f'<wp:docPr id="{shape_id}" name="Chart {shape_id}"/><wp:cNvGraphicFramePr/>'
+        f'<a:graphic><a:graphicData uri="{CHART_URI}"><c:chart r:id="{r_id}"/></a:graphicData></a:graphic>'
+        f'</wp:inline>'
+    )
+    drawing = OxmlElement("w:drawing")
+    drawing.append(inline)
+    run = doc.add_paragraph().add_run()
+    run._r.append(drawing)
@@ -0,0 +1,305 @@
+import io
+import re
+import zipfile
+from api.cache import file_digest, make_key
+from api.charts import START_COLOR, END_COLOR, add_native_chart, level_percentages, render_bar_chart
+from api.instrument import stage, timed
+from api.lazy import LazyModule
+from api.parallel import run_parallel
+from api import store
+from api.utils import LEVEL_COLUMNS, SCORING_VERSION, process_dataframe
+
+pd = LazyModule("pandas")
+
+# --- СРАВНЕНИЕ НАЧАЛА И КОНЦА ГОДА ---
+# Один движок для всех Word-отчетов сравнения. Режимы:
+#   cross  - срезы: каждая группа целиком, файлы независимы
+#   paired - пары: только дети, прошедшие обе диагностики (по Коду)
+#   both   - оба отчета одним ZIP-архивом
+# Файлы разбираются и считаются один раз: для обоих режимов нужны одни и те же
+# колонки (код, время и уровни), отличается только то, какие строки сравниваются.
+
+MODES = ("cross", "paired", "both")
+
+# Версия оформления Word-отчетов: входит в ключ кэша готовых файлов
+REPORT_VERSION = "1"
+
+METRICS = [
+    ("Когнитивное развитие", "Когнитивное развитие"),
+    ("Воображение_итог", "Воображение"),
+    ("ЭмСоцИнтеллект", "Эмоционально-социальный интеллект")
+]
+
+# Колонки расчета, нужные любому режиму
+COMPARE_OUTPUTS = ["Код", "Время"] + LEVEL_COLUMNS
+
+NO_MATCHES = 'Нет совпадений по кодам детей. Проверьте колонку "Код ребёнка"'
+
+# --- СОПОСТАВЛЕНИЕ ДЕТЕЙ ПО КОДУ ---
+# Для отчета нужны только уровни по показателям, поэтому до соединения
+# таблицы сокращаются до Кода, Времени и колонок *_уровень. Код в каждой
+# таблице делается уникальным (из повторов остается последняя по времени
+# запись) и становится индексом: соединение идет по индексу один-к-одному.
+
+def normalize_codes(codes):
+    """Коды как строки без пробелов по краям; пустые - NaN (числа 21 и 21.0 - один код)"""
+    codes = codes.astype("string").str.strip()
+    # Регулярное выражение - только для кандидатов вида 21.0 (пришли из Excel числом)
+    floats = codes.str.endswith(".0").fillna(False).to_numpy()
+    if floats.any():
+        codes[floats] = codes[floats].str.replace(r"^(\d+)\.0$", r"\1", regex=True)
+    return codes.mask(codes == "")
+
+def latest_by_code(df, columns):
+    """
+    Таблица с индексом по Коду и колонками columns: по одной строке на код,
+    из повторов - последняя по Времени (при равном или пустом времени - последняя в файле).
+    Возвращает (таблица, строк без кода, удалено повторов).
+    """
+    codes = normalize_codes(df["Код"])
+    has_code = codes.notna().to_numpy()
+    if "Время" in df.columns:
+        time = pd.to_datetime(df["Время"], errors="coerce", format="mixed", dayfirst=True)
+    else:
+        time = pd.Series(pd.NaT, index=df.index)
+    part = pd.DataFrame({"Код": codes, "_time": time}, index=df.index)
+    part = part.join(df[columns])[has_code]
+    part = part.sort_values("_time", kind="stable", na_position="first")
+    latest = part[~part["Код"].duplicated(keep="last")].sort_index()
+    latest = latest.drop(columns="_time").set_index("Код")
+    return latest, int((~has_code).sum()), len(part) - len(latest)
+
+def pair_frames(df_start, df_end):
+    """
+    Соединяет два среза по Коду (только общие колонки уровней, суффиксы _Start/_End).
+    Возвращает (таблица пар, статистика сопоставления).
+    """
+    columns = [f"{col}_уровень" for col, _ in METRICS
+               if f"{col}_уровень" in df_start.columns and f"{col}_уровень" in df_end.columns]
+    start, no_code_start, dup_start = latest_by_code(df_start, columns)
+    end, no_code_end, dup_end = latest_by_code(df_end, columns)
+    merged = start.join(end, how="inner", lsuffix="_Start", rsuffix="_End")
+    stats = {
+        "matched": len(merged),
+        "only_start": len(start) - len(merged),
+        "only_end": len(end) - len(merged),
+        "duplicates_start": dup_start,
+        "duplicates_end": dup_end,
+        "no_code_start": no_code_start,
+        "no_code_end": no_code_end,
+    }
+    return merged, stats
+
+def describe_pairing(stats):
+    """Строки отчета о сопоставлении: кто не нашел пару, сколько было повторов"""
+    lines = []
+    if stats["only_start"] or stats["only_end"]:
+        lines.append(f'Не вошли в сравнение: {stats["only_start"]} детей только в начальной диагностике, '
+                     f'{stats["only_end"]} только в итоговой.')
+    if stats["duplicates_start"] or stats["duplicates_end"]:
+        lines.append(f'Повторные записи по коду (учтена последняя по времени): '
+                     f'{stats["duplicates_start"]} в начальной, {stats["duplicates_end"]} в итоговой диагностике.')
+    if stats["no_code_start"] or stats["no_code_end"]:
+        lines.append(f'Записи без кода ребенка: {stats["no_code_start"]} в начальной, '
+                     f'{stats["no_code_end"]} в итоговой диагностике.')
+    return lines
+
+def split_pairs(merged):
+    """Таблица пар -> (уровни на начало, уровни на конец) с обычными именами колонок"""
+    start = merged.filter(regex="_Start$").rename(columns=lambda c: c[:-len("_Start")])
+    end = merged.filter(regex="_End$").rename(columns=lambda c: c[:-len("_End")])
+    return start, end
+
+# --- СОДЕРЖАНИЕ ОТЧЕТОВ ---
+# Отчет любого режима - это вступление (абзацы из кусков текста) и пара
+# таблиц уровней: что было на начало года и что стало на конец.
+
+def cross_report(df_start, df_end):
+    """Сравнение срезов: обе группы целиком"""
+    intro = [
+        [('Анализ проводится методом сравнения срезов (общие показатели группы на начало и конец периода).', False)],
+        [('Выборка "Начало года": ', True), (f'{len(df_start)} детей.', False)],
+        [('Выборка "Конец года": ', True), (f'{len(df_end)} детей.', False)],
+    ]
+    return {"mode": "cross", "intro": intro, "start": df_start, "end": df_end, "stats": None}
+
+def paired_report(df_start, df_end):
+    """Сравнение пар: только дети с кодом в обоих файлах (последняя запись по коду)"""
+    merged, stats = pair_frames(df_start, df_end)
+    start, end = split_pairs(merged)
+    intro = [[(f'Выборка: {len(merged)} детей (прошедших обе диагностики).', False)]]
+    intro += [[(line, False)] for line in describe_pairing(stats)]
+    if len(merged) == 0:
+        # Без пар сравнивать нечего: только вступление, без разделов
+        intro.append([(NO_MATCHES + '.', False)])
+        start, end = start[[]], end[[]]
+    else:
+        intro.append([('Сравнение результатов начальной и итоговой диагностики.', False)])
+    return {"mode": "paired", "intro": intro, "start": start, "end": end, "stats": stats}
+
+@timed("chart")
+def generate_chart(df_start, df_end, metric, title):
+    """Рисует график сравнения: доли уровней на начало и конец года"""
+    pre = level_percentages(df_start, f"{metric}_уровень")
+    post = level_percentages(df_end, f"{metric}_уровень")
+    # В легенде без количества детей
+    return render_bar_chart(title, [('Начало года', pre), ('Конец года', post)])
+
+def build_section(task):
+    """
+    Данные одного раздела отчета: доли уровней, изменение доли «выше нормативного»
+    и PNG-график. Выполняется в процессе пула, поэтому получает только колонку уровней.
+    """
+    col, name, df_start, df_end, chart_format = task
+    level_col = f"{col}_уровень"
+    pct_high_start = (df_start[level_col] == "выше нормативного").mean()
+    pct_high_end = (df_end[level_col] == "выше нормативного").mean()
+    return {
+        "pre": level_percentages(df_start, level_col),
+        "post": level_percentages(df_end, level_col),
+        "diff": pct_high_end - pct_high_start,
+        "png": generate_chart(df_start, df_end, col, name).getvalue() if chart_format == "png" else None,
+    }
+
+def report_sections(report):
+    """Показатели, которые есть в обеих таблицах отчета"""
+    return [(col, name) for col, name in METRICS
+            if f"{col}_уровень" in report["start"].columns and f"{col}_уровень" in report["end"].columns]
+
+def write_document(output, report, sections, results, chart_format="png"):
+    """Собирает Word-документ отчета из готовых разделов и пишет в output"""
+    with stage("docx"):
+        _write_document(output, report, sections, results, chart_format)
+
+def _write_document(output, report, sections, results, chart_format):
+    # python-docx грузится только здесь, а не при старте функции
+    from docx import Document
+    from docx.shared import Inches, Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = Document()
+
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(12)
+
+    h = doc.add_heading('Сравнительный аналитический отчет', 0)
+    h.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    for runs in report["intro"]:
+        p = doc.add_paragraph()
+        for text, bold in runs:
+            run = p.add_run(text)
+            if bold:
+                run.bold = True
+
+    for (col, name), section in zip(sections, results):
+        doc.add_heading(f'Показатель: {name}', level=1)
+
+        if chart_format == "native":
+            add_native_chart(doc, name, [
+                ('Начало года', section["pre"], START_COLOR),
+                ('Конец года', section["post"], END_COLOR),
+            ], width=Inches(6))
+        else:
+            doc.add_picture(io.BytesIO(section["png"]), width=Inches(6))
+
+        # Авто-вывод
+        diff = section["diff"]
+
+        p = doc.add_paragraph()
+        if diff > 0:
+            runner = p.add_run(f"Доля детей с высоким уровнем выросла на {diff*100:.1f}%.")
+            runner.font.color.rgb = RGBColor(0, 100, 0)
+        elif diff < 0:
+            p.add_run(f"Доля детей с высоким уровнем снизилась на {abs(diff)*100:.1f}%.")
+        else:
+            p.add_run("Изменений в группе с высоким уровнем не зафиксировано.")
+
+    with stage("docx_save"):
+        doc.save(output)
+
+# --- ОТЧЕТ (без привязки к Flask: вызывается и из фоновых задач) ---
+
+def report_filename(upload_name, mode="cross"):
+    """Имя отчета: номер группы из имени файла «начала года» (12-34...) и режим"""
+    match = re.match(r'(\d+)-(\d+)', upload_name or "")
+    prefix = f"{match.group(1)}-{match.group(2)}" if match else "Report"
+    if mode == "paired":
+        return f"{prefix}_comparison.docx"
+    if mode == "both":
+        return f"{prefix}_comparison.zip"
+    return f"{prefix}_comparison_full_group.docx"
+
+def report_key(f1, f2, chart_format="png", mode="cross"):
+    """Ключ кэша готового отчета (он же ETag)"""
+    return make_key("compare", mode, chart_format, REPORT_VERSION, SCORING_VERSION, file_digest(f1), file_digest(f2))
+
+def build_report(f1, f2, output, chart_format="png", progress=None, mode="cross"):
+    """
+    Сравнивает начало и конец года и пишет отчет в output: Word-документ
+    (cross, paired) или ZIP с обоими документами (both).
+    Возвращает статистику сопоставления по Коду (None для cross).
+    """
+    if mode not in MODES:
+        raise ValueError("Неизвестный режим сравнения")
+
+    # В хранилище сохраняется вся посчитанная таблица, иначе достаточно уровней
+    outputs = None if store.enabled() else COMPARE_OUTPUTS
+    if progress: progress(0.05, "Расчет показателей: начало года")
+    df_start = process_dataframe(f1, outputs)
+    if progress: progress(0.3, "Расчет показателей: конец года")
+    df_end = process_dataframe(f2, outputs)
+    if store.enabled():
+        store.save_upload(f1, df_start, half="start")
+        store.save_upload(f2, df_end, half="end")
+    if progress: progress(0.55, "Построение графиков")
+    return write_report(df_start, df_end, output, chart_format, progress, mode, getattr(f1, "filename", None))
+
+def build_stored_report(wave_start, wave_end, output, chart_format="png", mode="cross", organization=None, age=None):
+    """
+    То же сравнение по сохраненным результатам (api/store.py): волны wave_start
+    и wave_end с отбором по организации и возрасту, без разбора файлов.
+    """
+    if mode not in MODES:
+        raise ValueError("Неизвестный режим сравнения")
+    df_start = store.load_frame(wave_start, organization, age, COMPARE_OUTPUTS)
+    df_end = store.load_frame(wave_end, organization, age, COMPARE_OUTPUTS)
+    if df_start.empty or df_end.empty:
+        raise ValueError("Нет сохраненных результатов для " + (wave_start if df_start.empty else wave_end))
+    return write_report(df_start, df_end, output, chart_format, mode=mode)
+
+def write_report(df_start, df_end, output, chart_format="png", progress=None, mode="cross", upload_name=None):
+    """Отчет по посчитанным таблицам начала и конца года; возвращает статистику пар"""
+    reports = []
+    if mode in ("cross", "both"):
+        reports.append(cross_report(df_start, df_end))
+    if mode in ("paired", "both"):
+        reports.append(paired_report(df_start, df_end))
+        # Отдельный отчет по парам без пар не имеет смысла
+        if mode == "paired" and reports[-1]["stats"]["matched"] == 0:
+            raise ValueError(NO_MATCHES)
+
+    # Доли уровней и графики всех разделов всех отчетов считаются одним пулом
+    # (при одном ядре или KIDSKI_WORKERS=1 - по очереди в этом процессе),
+    # документы собираются в исходном порядке показателей
+    plan = [(report, report_sections(report)) for report in reports]
+    tasks = [(col, name, report["start"][[f"{col}_уровень"]], report["end"][[f"{col}_уровень"]], chart_format)
+             for report, sections in plan for col, name in sections]
+    # Родные графики Word не рисуются, пул для них не нужен
+    with stage("sections"):
+        results = run_parallel(build_section, tasks) if chart_format == "png" else [build_section(t) for t in tasks]
+    if progress: progress(0.85, "Формирование Word")
+
+    if mode == "both":
+        # docx уже сжат внутри - повторно не упаковываем (ZIP_STORED)
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zf:
+            for report, sections in plan:
+                doc = io.BytesIO()
+                write_document(doc, report, sections, results[:len(sections)], chart_format)
+                results = results[len(sections):]
+                zf.writestr(report_filename(upload_name, report["mode"]), doc.getvalue())
+    else:
+        report, sections = plan[0]
+        write_document(output, report, sections, results, chart_format)
+    return next((report["stats"] for report in reports if report["stats"] is not None), None)
@@ -1,12 +1,19 @@
-from flask import Flask, request, send_file, jsonify, render_template_string
-import pandas as pd
-import io
-import re
-import xlsxwriter
-from api.utils import process_dataframe, to_float # Импорт логики
+from flask import Flask, request, jsonify, render_template_string, url_for
+from api.cache import ARTIFACT_CACHE, env_int
+from api.responses import cached_report, not_modified, send_report, spooled_output
+from api.charts import CHART_FORMATS
+from api.instrument import metrics_report, traced
+from api.comparison import MODES as COMPARE_MODES
+from api import jobs, store
+from api.workbook import build_incremental_report, build_report, report_filename, report_key
+from api.batch import (BATCH_FILENAME, build_report as build_batch_report, report_key as batch_report_key,
+                       save_uploads as save_batch_uploads)
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Лимит загрузки - с большим запасом выше порога потоковой обработки
+# (KIDSKI_CHUNKED_MB): такие CSV не читаются в память целиком, а werkzeug
+# держит большую загрузку во временном файле
+app.config['MAX_CONTENT_LENGTH'] = env_int("KIDSKI_MAX_UPLOAD_MB", 1024) * 1024 * 1024
 
 HTML_TEMPLATE = '''<!DOCTYPE html>
 <html lang="ru">
@@ -44,6 +51,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         .success { background: #f0fff4; color: #2f855a; }
         
         .file-name { font-size: 0.9rem; color: #4a5568; margin-top: 0.5rem; font-weight: 500; }
+        .option { display: block; font-size: 0.9rem; color: #4a5568; margin-top: 0.5rem; cursor: pointer; }
     </style>
 </head>
 <body>
@@ -53,6 +61,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         <div class="tabs">
             <div class="tab active" onclick="switchTab('single')">Один файл (Excel)</div>
             <div class="tab" onclick="switchTab('compare')">Сравнение (Word)</div>
+            <div class="tab" onclick="switchTab('batch')">Пакет (ZIP)</div>
         </div>
 
         <div id="single" class="form-content active">
@@ -83,10 +92,31 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                     <div id="nameEnd" class="file-name"></div>
                     <input type="file" id="fileEnd" hidden>
                 </div>
+                <label class="option">Режим:
+                    <select id="compareMode">
+                        <option value="cross">Срезы (вся группа)</option>
+                        <option value="paired">Пары (по коду ребенка)</option>
+                        <option value="both">Оба отчета (ZIP)</option>
+                    </select>
+                </label>
+                <label class="option"><input type="checkbox" id="nativeCharts"> Редактируемые графики Word (без картинок)</label>
                 <button type="submit" class="btn btn-green">Сравнить и Скачать Word</button>
             </form>
         </div>
 
+        <div id="batch" class="form-content">
+            <p>Отчет по каждому файлу и общая сводка одним архивом</p>
+            <form onsubmit="handleBatch(event)">
+                <div class="upload-area" onclick="document.getElementById('fileBatch').click()">
+                    <span class="icon">🗂️</span>
+                    <span>Выберите несколько файлов или ZIP-архив</span>
+                    <div id="nameBatch" class="file-name"></div>
+                    <input type="file" id="fileBatch" multiple hidden>
+                </div>
+                <button type="submit" class="btn btn-blue">Обработать и Скачать ZIP</button>
+            </form>
+        </div>
+
         <div id="status"></div>
     </div>
 
@@ -110,6 +140,15 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         document.getElementById('fileSingle').onchange = e => document.getElementById('nameSingle').innerText = e.target.files[0]?.name || '';
         document.getElementById('fileStart').onchange = e => document.getElementById('nameStart').innerText = e.target.files[0]?.name || '';
         document.getElementById('fileEnd').onchange = e => document.getElementById('nameEnd').innerText = e.target.files[0]?.name || '';
+        document.getElementById('fileBatch').onchange = e => document.getElementById('nameBatch').innerText = Array.from(e.target.files).map(f => f.name).join(', ');
+
+        // Фоновые задачи включаются на сервере (KIDSKI_JOBS=1), иначе - обычный запрос
+        const JOBS_ENABLED = {{ 'true' if jobs_enabled else 'false' }};
+
+        async function submitForm(fd, url) {
+            if (JOBS_ENABLED) return runJob(fd, url);
+            return handleResponse(await fetch(url, { method: 'POST', body: fd }));
+        }
 
         // Обработка ОДНОГО файла
         async function handleSingle(e) {
@@ -119,11 +158,11 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             
             showStatus("⏳ Обработка...", "");
             const fd = new FormData();
+            fd.append('kind', 'process');
             fd.append('file', file);
             
             try {
-                const res = await fetch('/api/process', { method: 'POST', body: fd });
-                handleResponse(res);
+                await submitForm(fd, '/api/process');
             } catch(err) { showStatus(err.message, "error"); }
         }
 
@@ -136,15 +175,51 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 
             showStatus("⏳ Анализ данных и генерация Word...", "");
             const fd = new FormData();
+            fd.append('kind', 'compare');
             fd.append('file_start', f1);
             fd.append('file_end', f2);
+            fd.append('chart_format', document.getElementById('nativeCharts').checked ? 'native' : 'png');
+            fd.append('mode', document.getElementById('compareMode').value);
+
+            try {
+                await submitForm(fd, '/api/compare');
+            } catch(err) { showStatus(err.message, "error"); }
+        }
+
+        // Обработка ПАКЕТА файлов
+        async function handleBatch(e) {
+            e.preventDefault();
+            const files = document.getElementById('fileBatch').files;
+            if (!files.length) return showStatus("Выберите файлы!", "error");
+
+            showStatus(`⏳ Обработка файлов: ${files.length}...`, "");
+            const fd = new FormData();
+            fd.append('kind', 'batch');
+            for (const f of files) fd.append('files', f);
 
             try {
-                const res = await fetch('/api/compare', { method: 'POST', body: fd });
-                handleResponse(res);
+                await submitForm(fd, '/api/batch');
             } catch(err) { showStatus(err.message, "error"); }
         }
 
+        // Фоновая задача: ставим в очередь, опрашиваем статус, скачиваем результат.
+        // Очередь недоступна (404) - тот же запрос синхронно на url
+        async function runJob(fd, url) {
+            const res = await fetch('/api/jobs', { method: 'POST', body: fd });
+            if (res.status === 404) return handleResponse(await fetch(url, { method: 'POST', body: fd }));
+            if (!res.ok) return handleResponse(res);
+            const job = await res.json();
+            while (true) {
+                await new Promise(r => setTimeout(r, 1000));
+                const st = await fetch(job.status_url);
+                if (!st.ok) return handleResponse(st);
+                const info = await st.json();
+                if (info.status === 'done') return handleResponse(await fetch(info.download_url));
+                if (info.status === 'error') return showStatus("❌ " + info.error, "error");
+                showStatus(`⏳ ${info.stage || 'Обработка'}... ${Math.round(info.progress * 100)}%`, "");
+            }
+        }
+
         async function handleResponse(res) {
             if (res.ok) {
                 const blob = await res.blob();
@@ -168,76 +243,168 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return render_template_string(HTML_TEMPLATE, jobs_enabled=jobs.ENABLED)
+
+def stored_wave_header(res, wave):
+    """Волна, в которую сохранена таблица (api/store.py), - в заголовке X-Stored-Wave"""
+    if wave:
+        res.headers['X-Stored-Wave'] = wave
+        res.headers['Access-Control-Expose-Headers'] = (
+            res.headers.get('Access-Control-Expose-Headers', 'X-Filename, ETag') + ', X-Stored-Wave')
+    return res
 
 @app.route('/api/process', methods=['POST'])
+@traced
 def process():
     try:
         f = request.files.get('file')
         if not f: return jsonify({'error': 'Нет файла'}), 400
-        
-        # 1. Считаем метрики (через utils.py)
-        df = process_dataframe(f)
-        
-        # 2. Формируем имя
-        match = re.match(r'(\d+)-(\d+)', f.filename)
-        name_part = f"{match.group(1)}-{match.group(2)}" if match else "Results"
-        filename = f"{name_part}_results.xlsx"
-
-        # 3. Генерируем Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            wb = writer.book
-            fmt_head = wb.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1, "align": "center"})
-            fmt_pct = wb.add_format({"num_format": "0.0%", "align": "center"})
-            
-            # --- ЛИСТ 1: Возрасты ---
-            age = df["Возраст"].value_counts().reset_index()
-            age.columns = ["Группа", "Кол-во"]
-            if not age.empty:
-                age.to_excel(writer, sheet_name="Возрасты", index=False)
-                ch = wb.add_chart({"type": "pie"})
-                ch.add_series({
-                    "categories": ["Возрасты", 1, 0, len(age), 0],
-                    "values": ["Возрасты", 1, 1, len(age), 1],
-                    "data_labels": {"percentage": True}
-                })
-                writer.sheets["Возрасты"].insert_chart("D2", ch)
-
-            # --- ЛИСТЫ ПОКАЗАТЕЛЕЙ (с % на графиках) ---
-            for metric in ["Когнитивное развитие", "Воображение_итог", "ЭмСоцИнтеллект"]:
-                sheet_name = metric.replace(" ", "_")[:30]
-                counts = df[f"{metric}_уровень"].value_counts().reindex(
-                    ["ниже нормативного", "нормативный", "выше нормативного"], fill_value=0
-                ).reset_index()
-                counts.columns = ["Уровень", "Кол-во"]
-                counts["Доля"] = counts["Кол-во"] / len(df)
-
-                counts.to_excel(writer, sheet_name=sheet_name, index=False)
-                ws = writer.sheets[sheet_name]
-                ws.set_column(0, 0, 20)
-                ws.set_column(2, 2, 10, fmt_pct)
-                
-                ch = wb.add_chart({"type": "column"})
-                ch.add_series({
-                    "name": metric,
-                    "categories": [sheet_name, 1, 0, 3, 0],
-                    "values": [sheet_name, 1, 2, 3, 2], # Колонка Доля
-                    "data_labels": {"value": True, "num_format": "0.0%"}
-                })
-                ch.set_y_axis({"num_format": "0%"})
-                ws.insert_chart("E2", ch)
-
-            # --- ЛИСТ ИТОГ ---
-            df.to_excel(writer, sheet_name="Полные_данные", index=False)
+        # Волна для хранилища результатов (пусто - по датам в файле)
+        wave = store.check_wave(request.form.get('wave'))
+
+        # 1. Формируем имя
+        filename = report_filename(f.filename)
+
+        # Растущая выгрузка: считаются только новые и измененные строки. Отчет зависит
+        # от содержимого базы, поэтому кэш готовых отчетов не используется
+        if request.form.get('incremental') == '1':
+            if not store.enabled(): return jsonify({'error': 'Хранилище результатов не включено'}), 400
+            output = spooled_output()
+            stats = build_incremental_report(f, output, wave=wave, source=request.form.get('source') or None)
+            output.seek(0)
+            res = send_report(output, filename)
+            res.headers['X-Stored-Wave'] = stats['wave']
+            res.headers['X-Rows-Scored'] = str(stats['scored'])
+            res.headers['X-Rows-Deleted'] = str(stats['deleted'])
+            res.headers['Access-Control-Expose-Headers'] += ', X-Stored-Wave, X-Rows-Scored, X-Rows-Deleted'
+            return res
+
+        # 2. Тот же файл уже обрабатывали - отдаем готовый отчет. Таблицы при этом
+        # может не быть в хранилище (другая волна, новая база) - сохраняем ее отдельно
+        etag = report_key(f)
+        cached = cached_report(etag, filename)
+        if cached is not None:
+            return stored_wave_header(cached, store.save_file(f, wave) if store.enabled() else None)
+
+        # 3. Считаем метрики и генерируем Excel (большой отчет уходит на диск)
+        output = spooled_output()
+        stored = build_report(f, output, wave=wave)
 
+        # 4. Сохраняем в кэш и отдаем кусками
         output.seek(0)
-        res = send_file(output, as_attachment=True, download_name=filename)
-        res.headers['X-Filename'] = filename
-        res.headers['Access-Control-Expose-Headers'] = 'X-Filename'
-        return res
+        ARTIFACT_CACHE.put(etag, output)
+        output.seek(0)
+        return stored_wave_header(send_report(output, filename, etag), stored)
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/batch', methods=['POST'])
+@traced
+def batch():
+    try:
+        files = [f for f in request.files.getlist('files') if f and f.filename]
+        if not files: return jsonify({'error': 'Нет файлов'}), 400
+
+        # 1. Тот же набор файлов уже обрабатывали - отдаем готовый архив
+        # (файлы все равно сохраняются в хранилище, если их там нет)
+        filename = BATCH_FILENAME
+        etag = batch_report_key(files)
+        cached = cached_report(etag, filename)
+        if cached is not None:
+            if store.enabled(): save_batch_uploads(files)
+            return cached
+
+        # 2. Раскрываем архивы, считаем файлы в пуле процессов, собираем ZIP
+        output = spooled_output()
+        build_batch_report(files, output)
+        output.seek(0)
+        ARTIFACT_CACHE.put(etag, output)
+        output.seek(0)
+        return send_report(output, filename, etag)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# --- ЗАМЕРЫ (см. api/instrument.py) ---
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    # Перцентили по этапам обработки в этом процессе (отчеты и фоновые задачи)
+    return jsonify(metrics_report())
+
+# --- ХРАНИЛИЩЕ РЕЗУЛЬТАТОВ (см. api/store.py) ---
+
+@app.route('/api/store', methods=['GET'])
+def store_waves():
+    if not store.enabled(): return jsonify({'error': 'Хранилище результатов не включено'}), 404
+    return jsonify(store.waves())
+
+@app.route('/api/store/summary', methods=['GET'])
+def store_summary():
+    # Распределение уровней запросом к базе: ?wave=&organization=&age=&by=Организация,Возраст
+    if not store.enabled(): return jsonify({'error': 'Хранилище результатов не включено'}), 404
+    try:
+        by = [g for g in request.args.get('by', 'Организация').split(',') if g]
+        return jsonify(store.summary(request.args.get('wave'), request.args.get('organization'),
+                                     request.args.get('age'), by))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# --- ФОНОВЫЕ ЗАДАЧИ (см. api/jobs.py) ---
+
+def job_info(info):
+    """Статус задачи для клиента со ссылками на опрос и скачивание"""
+    info["status_url"] = url_for("job_status", job_id=info["id"])
+    if info["status"] == jobs.DONE:
+        info["download_url"] = url_for("job_download", job_id=info["id"])
+    return info
+
+# Без KIDSKI_JOBS=1 маршруты задач отвечают 404, страница шлет синхронные запросы
+JOBS_DISABLED = {'error': 'Фоновые задачи не включены'}
+
+@app.route('/api/jobs', methods=['POST'])
+def job_submit():
+    if not jobs.ENABLED: return jsonify(JOBS_DISABLED), 404
+    try:
+        kind = request.form.get('kind', 'process')
+        uploads = {field: [f for f in request.files.getlist(field) if f and f.filename] for field in request.files}
+        options = {}
+        if kind == 'process':
+            options['wave'] = store.check_wave(request.form.get('wave'))
+            if request.form.get('incremental') == '1':
+                if not store.enabled(): return jsonify({'error': 'Хранилище результатов не включено'}), 400
+                options['incremental'] = True
+                options['source'] = request.form.get('source') or None
+        if kind == 'compare':
+            options['chart_format'] = request.form.get('chart_format', 'png')
+            if options['chart_format'] not in CHART_FORMATS: return jsonify({'error': 'Неизвестный формат графиков'}), 400
+            options['mode'] = request.form.get('mode', 'cross')
+            if options['mode'] not in COMPARE_MODES: return jsonify({'error': 'Неизвестный режим сравнения'}), 400
+        job_id = jobs.submit(kind, uploads, options)
+        return jsonify(job_info(jobs.status(job_id))), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if not jobs.ENABLED: return jsonify(JOBS_DISABLED), 404
+    info = jobs.status(job_id)
+    if info is None: return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(job_info(info))
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    if not jobs.ENABLED: return jsonify(JOBS_DISABLED), 404
+    found = jobs.result(job_id)
+    if found is None: return jsonify({'error': 'Отчет еще не готов'}), 409
+    path, filename, etag = found
+    return (etag and not_modified(etag)) or send_report(path, filename, etag)
+
 app = app
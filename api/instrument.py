@@ -0,0 +1,211 @@
+import functools
+import math
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from api.cache import env_int
+
+# --- ЗАМЕРЫ ЭТАПОВ ОБРАБОТКИ ---
+# Этапы (чтение файла, расчет, графики, сборка документа) отмечаются stage():
+# время, число строк и, при KIDSKI_TRACE_MEMORY=1, пик памяти по tracemalloc.
+# Замеры запроса уходят клиенту в заголовке Server-Timing и копятся в скользящем
+# окне для /api/metrics (отдельно в каждом процессе). Вне запроса или задачи
+# stage() ничего не записывает - так и в процессах пула: там работа видна только
+# как время охватывающего этапа (sections, files).
+
+# tracemalloc замедляет расчеты в разы - только для диагностики. Пик общий
+# для процесса: при параллельных запросах их память смешивается.
+TRACE_MEMORY = os.environ.get("KIDSKI_TRACE_MEMORY") == "1"
+METRICS_WINDOW = env_int("KIDSKI_METRICS_WINDOW", 500)
+PERCENTILES = (50, 90, 99)
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+_current = ContextVar("kidski_trace", default=None)
+
+class Stage:
+    """Замер одного этапа: секунды, строки (если известны), пик памяти в байтах (если меряется)"""
+    __slots__ = ("name", "seconds", "rows", "peak", "_child_peak")
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = rows
+        self.peak = None
+        self._child_peak = 0
+
+class Trace:
+    """Замеры одного запроса или задачи; этапы - в порядке завершения"""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.seconds = 0.0
+        self._open = []
+
+    def summary(self):
+        """Этапы с одинаковым именем складываются: {имя: {seconds, count, rows, peak}}"""
+        out = {}
+        for st in self.stages:
+            s = out.setdefault(st.name, {"seconds": 0.0, "count": 0, "rows": None, "peak": None})
+            s["seconds"] += st.seconds
+            s["count"] += 1
+            if st.rows is not None:
+                s["rows"] = (s["rows"] or 0) + st.rows
+            if st.peak is not None:
+                s["peak"] = max(s["peak"] or 0, st.peak)
+        return out
+
+@contextmanager
+def trace(name):
+    """Собирает замеры этапов внутри блока (в METRICS их записывает вызывающий)"""
+    t = Trace(name)
+    token = _current.set(t)
+    start = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t.seconds = time.perf_counter() - start
+        _current.reset(token)
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Отмечает этап: with stage("read") as st: ...; st.rows = len(df).
+    Вложенные этапы допускаются (в Server-Timing их время перекрывается).
+    """
+    st = Stage(name, rows)
+    t = _current.get()
+    if t is None:
+        yield st
+        return
+    base = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        # Сброс пика стер бы пик охватывающего этапа - сохраняем его
+        if t._open:
+            t._open[-1]._child_peak = max(t._open[-1]._child_peak, peak)
+        tracemalloc.reset_peak()
+        base = current
+    t._open.append(st)
+    start = time.perf_counter()
+    try:
+        yield st
+    finally:
+        st.seconds = time.perf_counter() - start
+        t._open.pop()
+        if base is not None:
+            peak = max(tracemalloc.get_traced_memory()[1], st._child_peak)
+            st.peak = max(peak - base, 0)
+            if t._open:
+                t._open[-1]._child_peak = max(t._open[-1]._child_peak, peak)
+        t.stages.append(st)
+
+def timed(name):
+    """Декоратор: каждый вызов функции - этап name"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# --- SERVER-TIMING ---
+
+def server_timing(t):
+    """Значение заголовка Server-Timing: этапы (мс) и total"""
+    parts = []
+    for name, s in t.summary().items():
+        desc = []
+        if s["count"] > 1:
+            desc.append(f"x{s['count']}")
+        if s["rows"] is not None:
+            desc.append(f"{s['rows']} rows")
+        if s["peak"] is not None:
+            desc.append(f"peak {s['peak'] / 2**20:.1f} MB")
+        part = f"{name};dur={s['seconds'] * 1000:.1f}"
+        if desc:
+            part += f';desc="{", ".join(desc)}"'
+        parts.append(part)
+    parts.append(f"total;dur={t.seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+def traced(view):
+    """
+    Декоратор Flask-обработчика: этапы запроса - в заголовке Server-Timing,
+    успешные запросы - в METRICS под путем запроса.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import make_response, request
+        with trace(request.path) as t:
+            res = make_response(view(*args, **kwargs))
+        res.headers['Server-Timing'] = server_timing(t)
+        exposed = res.headers.get('Access-Control-Expose-Headers')
+        res.headers['Access-Control-Expose-Headers'] = f"{exposed}, Server-Timing" if exposed else 'Server-Timing'
+        if res.status_code < 400:
+            METRICS.record(t)
+        return res
+    return wrapper
+
+# --- СКОЛЬЗЯЩИЕ ПЕРЦЕНТИЛИ ---
+
+def percentile(sorted_values, p):
+    """Перцентиль p (0-100) по отсортированному списку, метод ближайшего ранга"""
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+class StageMetrics:
+    """
+    Последние window замеров каждого этапа каждого маршрута (или вида задачи).
+    Хранятся только числа, поэтому память не растет со временем работы.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}   # (маршрут, этап) -> deque[(секунды, строки, пик)]
+        self._counts = {}    # (маршрут, этап) -> всего замеров
+
+    def record(self, t):
+        items = [(name, s["seconds"], s["rows"], s["peak"]) for name, s in t.summary().items()]
+        items.append(("total", t.seconds, None, None))
+        with self._lock:
+            for name, seconds, rows, peak in items:
+                key = (t.name, name)
+                if key not in self._samples:
+                    self._samples[key] = deque(maxlen=self.window)
+                self._samples[key].append((seconds, rows, peak))
+                self._counts[key] = self._counts.get(key, 0) + 1
+
+    def snapshot(self):
+        """{маршрут: {этап: count, window, p50_ms.., max_ms, rows_p50, peak_mb_max}}"""
+        with self._lock:
+            samples = {key: list(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+        out = {}
+        for (route, name), values in samples.items():
+            seconds = sorted(v[0] for v in values)
+            entry = {"count": counts[(route, name)], "window": len(values)}
+            for p in PERCENTILES:
+                entry[f"p{p}_ms"] = round(percentile(seconds, p) * 1000, 1)
+            entry["max_ms"] = round(seconds[-1] * 1000, 1)
+            rows = sorted(v[1] for v in values if v[1] is not None)
+            if rows:
+                entry["rows_p50"] = percentile(rows, 50)
+            peaks = [v[2] for v in values if v[2] is not None]
+            if peaks:
+                entry["peak_mb_max"] = round(max(peaks) / 2**20, 1)
+            out.setdefault(route, {})[name] = entry
+        return out
+
+METRICS = StageMetrics()
+
+def metrics_report():
+    """Содержимое /api/metrics"""
+    return {"window": METRICS.window, "trace_memory": tracemalloc.is_tracing(), "routes": METRICS.snapshot()}
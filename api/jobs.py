@@ -0,0 +1,309 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+from api.cache import ARTIFACT_CACHE, env_int
+from api.instrument import METRICS, trace
+
+# --- ФОНОВЫЕ ЗАДАЧИ ---
+# Долгие отчеты не держат HTTP-запрос: задача ставится в очередь (SQLite-файл
+# и каталог с входными файлами), клиент получает id, опрашивает статус и
+# забирает готовый файл. Задачи выполняют потоки-воркеры процесса, который
+# принял запрос; отдельный воркер запускается командой `python -m api.jobs`.
+# Брокер не нужен: несколько процессов с общим KIDSKI_JOBS_DIR делят одну очередь.
+#
+# Включается KIDSKI_JOBS=1 и только там, где процесс живет после ответа и все
+# экземпляры видят один KIDSKI_JOBS_DIR (gunicorn/контейнер, отдельный воркер).
+# На Vercel функция замораживается после ответа, а /tmp у экземпляров свой:
+# задача зависла бы в очереди, а опрос попадал бы на экземпляр, где ее нет.
+# Без флага страница и клиенты работают через синхронные /api/process, /api/compare, /api/batch.
+
+ENABLED = os.environ.get("KIDSKI_JOBS") == "1"
+JOBS_DIR = os.environ.get("KIDSKI_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "kidski-jobs")
+JOB_WORKERS = env_int("KIDSKI_JOB_WORKERS", 2)        # 0 - только внешний воркер
+JOB_TTL = env_int("KIDSKI_JOB_TTL", 24 * 3600)        # сколько хранить завершенные задачи, с
+JOB_STALE = env_int("KIDSKI_JOB_STALE", 15 * 60)      # "running" без обновлений дольше - воркер умер
+MAX_ATTEMPTS = 2
+POLL_INTERVAL = 1.0
+PURGE_INTERVAL = 600
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    error TEXT,
+    filename TEXT,
+    etag TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+# --- ВИДЫ ЗАДАЧ ---
+# Каждый вид: поля с файлами и функция, которая по файлам и опциям возвращает
+# (имя отчета, ключ кэша или None - не кэшировать, build(output, progress), save() -
+# сохранить входные файлы в хранилище, когда отчет взят из кэша, или None). Модули отчетов
+# импортируются только в воркере.
+
+def _process_job(files, options):
+    from api import store, workbook
+    f = files["file"][0]
+    if options.get("incremental"):
+        # Отчет зависит от содержимого базы - без ключа кэша
+        return (workbook.report_filename(f.filename), None,
+                lambda output, progress: workbook.build_incremental_report(
+                    f, output, progress, options.get("wave"), options.get("source")), None)
+    return (workbook.report_filename(f.filename), workbook.report_key(f),
+            lambda output, progress: workbook.build_report(f, output, progress, options.get("wave")),
+            (lambda: store.save_file(f, options.get("wave"))) if store.enabled() else None)
+
+def _compare_job(files, options):
+    from api import comparison, store
+    f1, f2 = files["file_start"][0], files["file_end"][0]
+    chart_format = options.get("chart_format", "png")
+    mode = options.get("mode", "cross")
+    return (comparison.report_filename(f1.filename, mode), comparison.report_key(f1, f2, chart_format, mode),
+            lambda output, progress: comparison.build_report(f1, f2, output, chart_format, progress, mode),
+            (lambda: (store.save_file(f1, half="start"), store.save_file(f2, half="end"))) if store.enabled() else None)
+
+def _batch_job(files, options):
+    from api import batch, store
+    return (batch.BATCH_FILENAME, batch.report_key(files["files"]),
+            lambda output, progress: batch.build_report(files["files"], output, progress),
+            (lambda: batch.save_uploads(files["files"])) if store.enabled() else None)
+
+JOB_KINDS = {
+    "process": (("file",), _process_job),
+    "compare": (("file_start", "file_end"), _compare_job),
+    "batch": (("files",), _batch_job),
+}
+
+# --- ОЧЕРЕДЬ (SQLite) ---
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def _connect():
+    global _schema_ready
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(JOBS_DIR, "jobs.db"), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        with _schema_lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _schema_ready = True
+    return conn
+
+def _job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+def submit(kind, uploads, options=None):
+    """
+    Ставит задачу в очередь: uploads - {поле: [FileStorage, ...]}.
+    Файлы сохраняются на диск, возвращается id задачи.
+    """
+    if not ENABLED:
+        raise RuntimeError("Фоновые задачи не включены (KIDSKI_JOBS=1)")
+    if kind not in JOB_KINDS:
+        raise ValueError("Неизвестный вид задачи")
+    fields, _ = JOB_KINDS[kind]
+    missing = [field for field in fields if not uploads.get(field)]
+    if missing:
+        raise ValueError("Не хватает файлов: " + ", ".join(missing))
+
+    job_id = uuid.uuid4().hex
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir)
+    inputs = {}
+    for field in fields:
+        for f in uploads[field]:
+            path = f"input-{len(os.listdir(job_dir))}"
+            f.save(os.path.join(job_dir, path))
+            inputs.setdefault(field, []).append([f.filename, path])
+
+    now = time.time()
+    params = json.dumps({"inputs": inputs, "options": options or {}}, ensure_ascii=False)
+    with closing(_connect()) as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, status, stage, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, params, QUEUED, "В очереди", now, now),
+        )
+    start_workers()
+    _wake.set()
+    return job_id
+
+def status(job_id):
+    """Состояние задачи (dict) или None, если такой нет"""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT id, kind, status, progress, stage, error, filename FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    # Задачу мог поставить процесс, где воркеры не запущены (или уже заморожены)
+    if row["status"] == QUEUED:
+        start_workers()
+    return dict(row)
+
+def result(job_id):
+    """(путь, имя файла, ETag) готового отчета или None"""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT filename, etag FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)
+        ).fetchone()
+    path = os.path.join(_job_dir(job_id), "result")
+    if row is None or not os.path.exists(path):
+        return None
+    return path, row["filename"], row["etag"]
+
+def claim():
+    """Забирает следующую задачу из очереди (атомарно между процессами) или None"""
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ? AND updated < ? AND attempts >= ?",
+                (ERROR, "Обработка прервана", now, RUNNING, now - JOB_STALE, MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND updated < ?) ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now - JOB_STALE),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, stage = ?, updated = ? WHERE id = ?",
+                    (RUNNING, "Запуск", now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return row
+
+def _update(job_id, **fields):
+    fields["updated"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with closing(_connect()) as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+def run_job(row):
+    """Выполняет задачу: строит отчет (или берет из кэша) и сохраняет его в каталог задачи"""
+    job_id = row["id"]
+    job_dir = _job_dir(job_id)
+    handles = []
+    try:
+        params = json.loads(row["params"])
+        files = {}
+        for field, entries in params["inputs"].items():
+            for name, path in entries:
+                # Файл не читается в память: большие CSV считаются кусками прямо с диска
+                f = open(os.path.join(job_dir, path), "rb")
+                f.filename = name
+                handles.append(f)
+                files.setdefault(field, []).append(f)
+
+        _, prepare = JOB_KINDS[row["kind"]]
+        filename, key, build, save = prepare(files, params["options"])
+
+        def progress(fraction, stage):
+            _update(job_id, progress=round(fraction, 3), stage=stage)
+
+        result_path = os.path.join(job_dir, "result")
+        cached = ARTIFACT_CACHE.get(key) if key else None
+        if cached is not None:
+            shutil.copyfile(cached, result_path)
+            if save is not None:
+                save()
+        else:
+            tmp = result_path + ".tmp"
+            with open(tmp, "wb") as output, trace(f"job:{row['kind']}") as t:
+                build(output, progress)
+            METRICS.record(t)
+            os.replace(tmp, result_path)
+            if key:
+                with open(result_path, "rb") as f:
+                    ARTIFACT_CACHE.put(key, f)
+
+        _update(job_id, status=DONE, progress=1.0, stage="Готово", filename=filename, etag=key)
+    except Exception as e:
+        _update(job_id, status=ERROR, stage="Ошибка", error=str(e))
+    finally:
+        for f in handles:
+            f.close()
+        # Входные файлы (и недописанный результат) больше не нужны
+        for name in os.listdir(job_dir) if os.path.isdir(job_dir) else []:
+            if name.startswith("input-") or name.endswith(".tmp"):
+                os.remove(os.path.join(job_dir, name))
+
+def purge_expired():
+    """Удаляет завершенные задачи старше JOB_TTL вместе с файлами"""
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?", (DONE, ERROR, time.time() - JOB_TTL)
+        ).fetchall()
+        for row in rows:
+            shutil.rmtree(_job_dir(row["id"]), ignore_errors=True)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+
+# --- ВОРКЕРЫ ---
+
+_wake = threading.Event()
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+def start_workers(count=None):
+    """Запускает потоки-воркеры (один раз на процесс; после fork - заново)"""
+    global _workers_pid
+    count = JOB_WORKERS if count is None else count
+    if not ENABLED or count <= 0 or _workers_pid == os.getpid():
+        return []
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return []
+        _workers_pid = os.getpid()
+        threads = [threading.Thread(target=_worker_loop, name=f"kidski-job-{i}", daemon=True)
+                   for i in range(count)]
+        for t in threads:
+            t.start()
+    return threads
+
+def _worker_loop():
+    last_purge = 0.0
+    while True:
+        try:
+            row = claim()
+        except sqlite3.Error:
+            row = None
+        if row is not None:
+            run_job(row)
+            continue
+        if time.time() - last_purge > PURGE_INTERVAL:
+            last_purge = time.time()
+            try:
+                purge_expired()
+            except (sqlite3.Error, OSError):
+                pass
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+
+if __name__ == "__main__":
+    # Отдельный процесс-воркер: python -m api.jobs (нужен KIDSKI_JOBS=1)
+    if not ENABLED:
+        raise SystemExit("Фоновые задачи не включены (KIDSKI_JOBS=1)")
+    for t in start_workers(max(JOB_WORKERS, 1)):
+        t.join()
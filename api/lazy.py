@@ -0,0 +1,27 @@
+import importlib
+
+# --- ЛЕНИВЫЙ ИМПОРТ ТЯЖЕЛЫХ МОДУЛЕЙ ---
+# pandas, numpy, matplotlib, python-docx грузятся секунды. Функции запускаются
+# «с холодного старта», и запрос, отклоненный проверкой, не должен за это платить:
+# модуль импортируется при первом обращении к его атрибуту.
+
+class LazyModule:
+    """Заместитель модуля: pd = LazyModule("pandas"), дальше pd.DataFrame как обычно"""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
@@ -0,0 +1,68 @@
+# --- ГРАФ МЕТРИК ---
+# Каждая расчетная колонка - узел: имя, колонки, от которых она зависит,
+# и функция расчета (узел может давать и несколько колонок за один шаг).
+# Вызывающий код просит набор выходных колонок и получает только то, что
+# для них нужно: лишние промежуточные метрики не считаются, а из файла
+# читаются только исходные колонки этих метрик.
+
+class MetricGraph:
+    """
+    Граф расчетных колонок. Узлы добавляются по порядку (add/node): входы
+    узла - исходные колонки таблицы или ранее добавленные узлы, поэтому
+    порядок добавления уже является порядком расчета.
+    """
+
+    def __init__(self):
+        # колонка -> узел (колонки узла, входы, функция)
+        self.nodes = {}
+
+    def add(self, name, inputs, compute):
+        """
+        Добавляет узел: compute(df) -> значения колонки name по колонкам inputs.
+        name может быть списком колонок - тогда compute возвращает их значения по порядку.
+        """
+        names = (name,) if isinstance(name, str) else tuple(name)
+        for n in names:
+            if n in self.nodes:
+                raise ValueError(f"Метрика уже объявлена: {n}")
+        node = (names, tuple(inputs), compute)
+        for n in names:
+            self.nodes[n] = node
+
+    def node(self, name, *inputs):
+        """Декоратор для add: @graph.node("Имя", "вход1", "вход2")"""
+        def register(compute):
+            self.add(name, inputs, compute)
+            return compute
+        return register
+
+    def plan(self, outputs=None):
+        """Узлы, которые нужно посчитать для outputs (None - все), в порядке расчета"""
+        needed = set(self.nodes) if outputs is None else set()
+        stack = [name for name in outputs or () if name in self.nodes]
+        while stack:
+            name = stack.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            stack.extend(i for i in self.nodes[name][1] if i in self.nodes)
+        # Колонки одного узла идут подряд: узел попадает в план один раз
+        nodes = {self.nodes[name][0]: self.nodes[name] for name in self.nodes if name in needed}
+        return list(nodes.values())
+
+    def sources(self, outputs=None):
+        """Исходные колонки таблицы, которые нужны для outputs (в порядке первого упоминания)"""
+        names = dict.fromkeys(name for name in (outputs or ()) if name not in self.nodes)
+        for _, inputs, _ in self.plan(outputs):
+            names.update(dict.fromkeys(i for i in inputs if i not in self.nodes))
+        return list(names)
+
+    def compute(self, df, outputs=None):
+        """Дописывает в df колонки узлов, нужных для outputs (None - всех); возвращает df"""
+        for names, _, compute in self.plan(outputs):
+            values = compute(df)
+            if len(names) == 1:
+                values = [values]
+            for name, column in zip(names, values):
+                df[name] = column
+        return df
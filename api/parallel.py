@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# --- ПУЛ ПРОЦЕССОВ ДЛЯ ТЯЖЕЛЫХ ШАГОВ ---
+# Файлы пакетной обработки и разделы отчета сравнения (графики) считаются
+# в отдельных процессах.
+# Если пул создать нельзя (например, в serverless-окружении без /dev/shm)
+# или задан KIDSKI_WORKERS=1, задачи выполняются по очереди в текущем процессе.
+# Пул создается лениво внутри многопоточного сервера, поэтому fork не годится:
+# дочерний процесс может унаследовать чужую захваченную блокировку и зависнуть.
+# Воркеры запускаются через forkserver (или spawn, где его нет). Холодный старт
+# с импортом pandas стоит секунды, но один раз на процесс: дальше пул общий.
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_broken = False
+
+def worker_count():
+    """Число процессов пула: KIDSKI_WORKERS или число ядер"""
+    value = os.environ.get("KIDSKI_WORKERS")
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            pass
+    return os.cpu_count() or 1
+
+def _mp_context():
+    """Безопасный способ запуска воркеров: forkserver, иначе spawn"""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def get_pool():
+    """Общий пул процессов (создается при первом обращении) или None"""
+    global _pool, _pool_broken
+    if _pool is not None or _pool_broken:
+        return _pool
+    with _pool_lock:
+        if _pool is None and not _pool_broken:
+            workers = worker_count()
+            if workers <= 1:
+                _pool_broken = True
+                return None
+            try:
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            except (OSError, NotImplementedError):
+                _pool_broken = True
+    return _pool
+
+def run_parallel(fn, items, progress=None):
+    """
+    Выполняет fn для каждого элемента в пуле процессов.
+    Результаты возвращаются в исходном порядке; fn и элементы должны пиклиться.
+    progress(done, total), если задан, вызывается после каждого готового элемента.
+    """
+    items = list(items)
+    pool = get_pool() if len(items) > 1 else None
+    if pool is None:
+        return _run_serial(fn, items, progress)
+    try:
+        return _collect(pool.map(fn, items), len(items), progress)
+    except BrokenProcessPool:
+        # Процесс пула упал: пересоздадим пул при следующем вызове
+        _reset_pool(pool)
+        return _run_serial(fn, items, progress)
+    except (OSError, NotImplementedError):
+        return _run_serial(fn, items, progress)
+
+def _run_serial(fn, items, progress):
+    return _collect((fn(item) for item in items), len(items), progress)
+
+def _collect(results, total, progress):
+    out = []
+    for result in results:
+        out.append(result)
+        if progress:
+            progress(len(out), total)
+    return out
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
@@ -0,0 +1,189 @@
+import codecs
+import csv
+import io
+import os
+from api.lazy import LazyModule
+
+pd = LazyModule("pandas")
+
+# --- ОПРЕДЕЛЕНИЕ ФОРМАТА ЗАГРУЖЕННОГО ФАЙЛА ---
+
+XLSX_MAGIC = b"PK\x03\x04"        # xlsx/xlsm - это zip-архив
+XLS_MAGIC = b"\xd0\xcf\x11\xe0"   # старый xls (OLE2)
+EXCEL_EXTENSIONS = {".xlsx", ".xlsm", ".xls"}
+
+# Для подбора разделителя CSV читаем только начало файла
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ";,\t|"
+
+def sniff_format(head, filename=None):
+    """
+    Определяет формат по сигнатуре (первые байты), а если она не распознана - по расширению.
+    Возвращает "xlsx", "xls" или "csv".
+    """
+    if head.startswith(XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(XLS_MAGIC):
+        return "xls"
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in EXCEL_EXTENSIONS:
+        return "xls" if ext == ".xls" else "xlsx"
+    return "csv"
+
+def decode_sample(head):
+    """Декодирует начало CSV. Возвращает (текст, кодировка для read_csv)"""
+    # BOM отрезаем сами: позиция ошибки utf-8-sig считается без него
+    body = head[len(codecs.BOM_UTF8):] if head.startswith(codecs.BOM_UTF8) else head
+    try:
+        return body.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError as e:
+        # Обрезанный на середине символа хвост - не ошибка кодировки
+        if e.reason == "unexpected end of data":
+            return body[:e.start].decode("utf-8"), "utf-8"
+    # Выгрузки из русского Excel часто в cp1251
+    return head.decode("cp1251", errors="replace"), "cp1251"
+
+def sniff_delimiter(sample, complete=False):
+    """
+    Подбирает разделитель по образцу: выбирается тот, при котором больше всего строк
+    имеют столько же полей, сколько заголовок. Кавычки и переносы строк внутри
+    заголовков (например, 'Художник'. \\nВведите...) разбираются корректно.
+    """
+    best, best_score = ",", (0, 0)
+    for delim in CSV_DELIMITERS:
+        try:
+            rows = [r for r in csv.reader(io.StringIO(sample), delimiter=delim) if r]
+        except csv.Error:
+            continue
+        # Последняя строка образца может быть обрезана
+        if not complete and len(rows) > 1:
+            rows = rows[:-1]
+        if not rows or len(rows[0]) < 2:
+            continue
+        width = len(rows[0])
+        score = (sum(len(r) == width for r in rows), width)
+        if score > best_score:
+            best, best_score = delim, score
+    return best
+
+def _column_filter(columns):
+    """Набор нужных заголовков -> функция для usecols (заголовки сравниваются без пробелов по краям)"""
+    if columns is None:
+        return None
+    wanted = {str(c).strip() for c in columns}
+    return lambda c: str(c).strip() in wanted
+
+def read_csv_fast(file_io, head, columns=None):
+    """Читает CSV быстрым C-движком; разделитель подбирается только по образцу"""
+    sample, encoding = decode_sample(head)
+    sep = sniff_delimiter(sample, complete=len(head) < SNIFF_BYTES)
+    usecols = _column_filter(columns)
+    file_io.seek(0)
+    try:
+        return pd.read_csv(file_io, sep=sep, encoding=encoding, engine="c", usecols=usecols)
+    except pd.errors.ParserError:
+        # Кривые строки: медленный, но более терпимый движок
+        file_io.seek(0)
+        return pd.read_csv(file_io, sep=sep, encoding=encoding, engine="python", usecols=usecols)
+
+def read_csv_chunks(file_io, head, columns=None, chunk_rows=50000, text_columns=()):
+    """
+    Читает CSV кусками по chunk_rows строк (генератор DataFrame), не загружая файл целиком.
+    text_columns читаются как текст во всех кусках, иначе тип колонки зависел бы
+    от того, какие строки попали в кусок.
+    """
+    sample, encoding = decode_sample(head)
+    sep = sniff_delimiter(sample, complete=len(head) < SNIFF_BYTES)
+    file_io.seek(0)
+    header = pd.read_csv(file_io, sep=sep, encoding=encoding, nrows=0).columns
+    text = {str(c).strip() for c in text_columns}
+    options = dict(sep=sep, encoding=encoding, usecols=_column_filter(columns), chunksize=chunk_rows,
+                   dtype={c: str for c in header if str(c).strip() in text})
+
+    done = 0
+    file_io.seek(0)
+    try:
+        with pd.read_csv(file_io, engine="c", **options) as reader:
+            for chunk in reader:
+                yield chunk
+                done += len(chunk)
+        return
+    except pd.errors.ParserError:
+        pass
+
+    # Кривые строки: дочитываем терпимым движком, уже отданные строки пропускаем
+    file_io.seek(0)
+    with pd.read_csv(file_io, engine="python", **options) as reader:
+        for chunk in reader:
+            if done >= len(chunk):
+                done -= len(chunk)
+                continue
+            yield chunk.iloc[done:]
+            done = 0
+
+def read_xlsx_columns(file_io, columns):
+    """
+    Потоковое чтение первого листа xlsx (openpyxl read-only): из каждой строки
+    берутся только нужные колонки, остальные ячейки не разбираются в DataFrame.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_io, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Размеры листа в выгрузках часто записаны неверно
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        keep = _column_filter(columns)
+        picked, seen = [], set()
+        for i, name in enumerate(header):
+            if name is None:
+                continue
+            name = str(name)
+            # Повторяющийся заголовок: берем первую колонку, как и при переименовании
+            if keep(name) and name.strip() not in seen:
+                picked.append((i, name))
+                seen.add(name.strip())
+
+        data = [[] for _ in picked]
+        n_rows = last_filled = 0
+        for row in rows:
+            filled = False
+            for values, (i, _) in zip(data, picked):
+                v = row[i] if i < len(row) else None
+                values.append(v)
+                filled = filled or v is not None
+            n_rows += 1
+            if filled:
+                last_filled = n_rows
+    finally:
+        wb.close()
+
+    # Пустые строки в конце листа отбрасываем (как pd.read_excel)
+    return pd.DataFrame({name: values[:last_filled] for values, (_, name) in zip(data, picked)},
+                        index=pd.RangeIndex(last_filled))
+
+def upload_stream(file_storage):
+    """
+    Поток с содержимым загрузки (позиция - в начале) для чтения без копии в память:
+    werkzeug уже держит файл в SpooledTemporaryFile (маленький - в памяти,
+    большой - на диске), парсеры читают прямо из него.
+    """
+    stream = getattr(file_storage, "stream", file_storage)
+    stream.seek(0)
+    return stream
+
+def read_table(file_io, filename=None, columns=None):
+    """
+    Читает Excel или CSV в DataFrame, формат определяется без пробного парсинга.
+    columns - заголовки исходного файла, которые нужны (None - читать все).
+    """
+    head = file_io.read(SNIFF_BYTES)
+    file_io.seek(0)
+    fmt = sniff_format(head, filename)
+    if fmt == "csv":
+        return read_csv_fast(file_io, head, columns)
+    if fmt == "xlsx" and columns is not None:
+        return read_xlsx_columns(file_io, columns)
+    return pd.read_excel(file_io, sheet_name=0, usecols=_column_filter(columns))
@@ -0,0 +1,49 @@
+import tempfile
+from flask import current_app, request, send_file
+from api.cache import ARTIFACT_CACHE, env_int
+
+# --- ОТДАЧА ГОТОВЫХ ФАЙЛОВ ---
+
+# Отчет собирается в памяти до этого размера, дальше - во временном файле
+SPOOL_MAX_BYTES = env_int("KIDSKI_SPOOL_MB", 8) * 1024 * 1024
+
+def spooled_output():
+    """Буфер для файла отчета: в памяти, пока маленький, иначе на диске"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+
+def not_modified(etag):
+    """Ответ 304, если у клиента уже есть этот отчет (If-None-Match), иначе None"""
+    if etag not in request.if_none_match:
+        return None
+    res = current_app.response_class(status=304)
+    res.set_etag(etag)
+    return res
+
+def send_report(source, filename, etag=None):
+    """
+    Отдает файл отчета (путь или файловый объект с текущей позиции) с X-Filename и ETag.
+    Файловый объект отдается кусками и закрывается после отправки.
+    """
+    res = send_file(source, as_attachment=True, download_name=filename, etag=False)
+    if res.content_length is None and hasattr(source, "seek"):
+        pos = source.tell()
+        res.content_length = source.seek(0, 2) - pos
+        source.seek(pos)
+    if etag:
+        res.set_etag(etag)
+    res.headers['X-Filename'] = filename
+    res.headers['Access-Control-Expose-Headers'] = 'X-Filename, ETag'
+    return res
+
+def cached_report(etag, filename):
+    """
+    Ответ из кэша готовых отчетов: 304, если файл уже у клиента,
+    сам файл, если он сохранен, иначе None (отчет нужно строить).
+    """
+    res = not_modified(etag)
+    if res is not None:
+        return res
+    path = ARTIFACT_CACHE.get(etag)
+    if path is not None:
+        return send_report(path, filename, etag)
+    return None
@@ -0,0 +1,561 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from itertools import chain, repeat
+from api.cache import file_digest
+from api.instrument import stage
+from api.lazy import LazyModule
+from api.utils import (CHUNK_ROWS, COLUMN_MAPPING, LEVEL_COLUMNS, LEVELS, QUALITY_COLUMNS, SCORED_METRICS, SCORING,
+                       SCORING_VERSION, TEXT_COLUMNS, compact_frame, is_large_csv, iter_scored_chunks,
+                       iter_upload_frames, level_dtype, process_dataframe, score_frame, widen_float32)
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+# --- ХРАНИЛИЩЕ ПОСЧИТАННЫХ РЕЗУЛЬТАТОВ (SQLite) ---
+# Включается переменной KIDSKI_STORE_DB (путь к файлу базы). Каждая обработанная
+# загрузка сохраняется построчно вместе с волной диагностики (учебный год и
+# начало/конец), после чего сравнения и сводки строятся запросами по индексам
+# (Код, Организация, Возраст, волна), а не повторным разбором файлов. Повторная
+# выгрузка тех же ответов заменяет сохраненные строки (см. row_keys).
+# Хранилище локальное: на Vercel файл в /tmp живет только вместе с экземпляром функции.
+
+STORE_DB = os.environ.get("KIDSKI_STORE_DB") or None
+
+# Колонки таблицы результатов - все колонки посчитанной таблицы, в том же порядке
+STORE_COLUMNS = list(dict.fromkeys(COLUMN_MAPPING.values())) + [
+    name for name in SCORING.nodes if name not in COLUMN_MAPPING.values()]
+
+# Служебные колонки строк (см. SCHEMA): выгрузка, ключ строки (row_keys), отпечаток исходных
+# ячеек и маска замененных ячеек (QUALITY_COLUMNS) - последние два знает только sync_export
+ROW_META = ["source", "row_key", "fingerprint", "coerced"]
+
+# Волна: "2024-2025:start" - учебный год и начало (start) или конец (end) года
+WAVE_PATTERN = re.compile(r"[A-Za-z0-9:._/-]{1,64}")
+
+# Разрезы, по которым строятся сводки
+SUMMARY_GROUPS = ("wave", "Организация", "Возраст")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    wave TEXT NOT NULL,
+    filename TEXT,
+    scoring_version TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    UNIQUE (digest, wave)
+);
+CREATE TABLE IF NOT EXISTS inferred_waves (
+    digest TEXT NOT NULL,
+    half TEXT NOT NULL,
+    wave TEXT NOT NULL,
+    PRIMARY KEY (digest, half),
+    FOREIGN KEY (digest, wave) REFERENCES uploads (digest, wave) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS results (
+    upload INTEGER NOT NULL REFERENCES uploads (id) ON DELETE CASCADE,
+    wave TEXT NOT NULL,
+    source TEXT,
+    row_key TEXT,
+    fingerprint TEXT,
+    coerced INTEGER
+);
+CREATE TABLE IF NOT EXISTS totals (
+    source TEXT NOT NULL,
+    wave TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (source, wave, kind, name)
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS results_upload ON results (upload);
+CREATE INDEX IF NOT EXISTS results_code ON results ("Код", wave);
+CREATE INDEX IF NOT EXISTS results_org ON results (wave, "Организация");
+CREATE INDEX IF NOT EXISTS results_age ON results (wave, "Возраст");
+CREATE UNIQUE INDEX IF NOT EXISTS results_key ON results (wave, row_key);
+CREATE INDEX IF NOT EXISTS results_source ON results (source, wave);
+"""
+
+def enabled():
+    return STORE_DB is not None
+
+def _q(name):
+    """Имя колонки для SQL (в именах кириллица, пробелы и дефисы)"""
+    return '"' + name.replace('"', '""') + '"'
+
+def _column_type(name):
+    if name == "ID":
+        return "INTEGER"
+    if name in TEXT_COLUMNS or name in LEVEL_COLUMNS:
+        return "TEXT"
+    return "REAL"
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def _connect():
+    global _schema_ready
+    if STORE_DB is None:
+        raise ValueError("Хранилище результатов не включено (KIDSKI_STORE_DB)")
+    os.makedirs(os.path.dirname(os.path.abspath(STORE_DB)), exist_ok=True)
+    conn = sqlite3.connect(STORE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    if not _schema_ready:
+        with _schema_lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Новые показатели в SCORING - новые колонки в уже созданной базе
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(results)")}
+            for name in STORE_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {_q(name)} {_column_type(name)}")
+            conn.executescript(INDEXES)
+            _schema_ready = True
+    return conn
+
+# --- ВОЛНА ДИАГНОСТИКИ ---
+
+def check_wave(wave):
+    """Волна из запроса: None (определить по датам) или строка вида 2024-2025:start"""
+    if wave in (None, ""):
+        return None
+    if not WAVE_PATTERN.fullmatch(wave):
+        raise ValueError("Волна - латиница, цифры и :._/- (например, 2024-2025:start)")
+    return wave
+
+def infer_wave(df, half=None):
+    """
+    Волна по колонке Время: учебный год по средней дате заполнения, начало года -
+    август-декабрь, конец - январь-июль (half задает половину явно).
+    None, если дат в таблице нет.
+    """
+    if "Время" not in df.columns:
+        return None
+    times = pd.to_datetime(df["Время"], format="mixed", dayfirst=True, errors="coerce").dropna()
+    if times.empty:
+        return None
+    median = times.sort_values().iloc[len(times) // 2]
+    first = median.year if median.month >= 8 else median.year - 1
+    half = half or ("start" if median.month >= 8 else "end")
+    return f"{first}-{first + 1}:{half}"
+
+# --- ИТОГИ ДЛЯ СВОДНЫХ ЛИСТОВ ---
+# Число строк, возрастов, уровней и замененных ячеек по (выгрузка, волна) лежат в
+# таблице totals и меняются вместе со строками: вклад заменяемых и удаляемых строк
+# вычитается, вклад записанных - прибавляется. Поэтому сводка растущей выгрузки
+# не требует проходить по всем ее строкам.
+
+TOTALS_UPSERT = ("INSERT INTO totals (source, wave, kind, name, n) VALUES (?, ?, ?, ?, ?) "
+                 "ON CONFLICT (source, wave, kind, name) DO UPDATE SET n = n + excluded.n")
+
+def _bump(conn, subset, params, sign):
+    """Вклад строк results, отобранных условием subset, в totals: sign=1 - прибавить, -1 - вычесть"""
+    rows = f"FROM results WHERE source IS NOT NULL AND ({subset})"
+    items = [(source, wave, "rows", "", sign * n) for source, wave, n in
+             conn.execute(f"SELECT source, wave, COUNT(*) {rows} GROUP BY source, wave", params)]
+    # Возрасты - в порядке первого появления: порядок записей totals задает порядок равных в отчете
+    items += [(source, wave, "age", age, sign * n) for source, wave, age, n in conn.execute(
+        f'SELECT source, wave, "Возраст", COUNT(*) {rows} AND "Возраст" IS NOT NULL '
+        f'GROUP BY source, wave, "Возраст" ORDER BY MIN(rowid)', params)]
+    for metric in SCORED_METRICS:
+        col = _q(metric + "_уровень")
+        items += [(source, wave, "level", f"{metric}: {level}", sign * n) for source, wave, level, n in conn.execute(
+            f"SELECT source, wave, {col}, COUNT(*) {rows} AND {col} IS NOT NULL GROUP BY source, wave, {col}", params)]
+    masks = ", ".join(f"SUM((coerced >> {i}) & 1)" for i in range(len(QUALITY_COLUMNS)))
+    for source, wave, *counts in conn.execute(f"SELECT source, wave, {masks} {rows} GROUP BY source, wave", params):
+        items += [(source, wave, "coerced", col, sign * n) for col, n in zip(QUALITY_COLUMNS, counts) if n]
+    conn.executemany(TOTALS_UPSERT, items)
+
+def _delete_rows(conn, subset, params):
+    """Удаляет строки results по условию вместе с их вкладом в totals; возвращает число строк"""
+    _bump(conn, subset, params, -1)
+    return conn.execute(f"DELETE FROM results WHERE {subset}", params).rowcount
+
+# --- ЗАПИСЬ ---
+# Строка результата определяется волной и ключом ответа (row_keys): одна и та же
+# анкета из повторной или дополненной выгрузки заменяет сохраненную строку, а не
+# добавляется второй раз. Ключ общий для сохранения посчитанного файла (save_frames)
+# и инкрементальной обработки (sync_export).
+
+# Колонки ключа строки
+KEY_COLUMNS = ("ID", "Код", "Время")
+
+def source_name(filename):
+    """Имя выгрузки по имени файла: без расширения и суффикса копии « (2)»"""
+    stem = os.path.splitext(os.path.basename(filename or ""))[0]
+    return re.sub(r"\s*\(\d+\)$", "", stem).strip() or "upload"
+
+def _canonical(s):
+    """
+    Колонка без зависимости от типа, выведенного парсером: целые с пропуском в
+    соседней строке читаются как float - числа приводятся к float64
+    """
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype("float64")
+    return s
+
+def row_fingerprints(raw):
+    """Отпечатки строк прочитанной (еще не очищенной) таблицы"""
+    canonical = pd.DataFrame({i: _canonical(s) for i, (_, s) in enumerate(raw.items())})
+    hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    return [f"{SCORING_VERSION}:{h:016x}" for h in hashes.tolist()]
+
+def _key_values(s):
+    s = _canonical(s)
+    missing = s.isna().tolist()
+    if s.dtype == np.float64:
+        return [None if miss else (str(int(v)) if v.is_integer() else repr(v)) for v, miss in zip(s.tolist(), missing)]
+    return [None if miss else str(v).strip() for v, miss in zip(s.tolist(), missing)]
+
+def row_keys(df, fingerprints=None):
+    """
+    Ключи строк: ID|Код|Время (нужны Время и хотя бы одно из ID, Код),
+    а если их нет - отпечаток строки. Годятся и исходная, и посчитанная таблица.
+    """
+    parts = [_key_values(df[c]) if c in df.columns else [None] * len(df) for c in KEY_COLUMNS]
+    keys = [f"{i or ''}|{k or ''}|{t}" if t is not None and (i is not None or k is not None) else None
+            for i, k, t in zip(*parts)]
+    if None in keys:
+        fingerprints = fingerprints or row_fingerprints(df)
+        keys = [key or "#" + fp for key, fp in zip(keys, fingerprints)]
+    return keys
+
+# Порядок значений в _records
+INSERT_COLUMNS = ["upload", "wave"] + ROW_META + STORE_COLUMNS
+
+def _insert_sql():
+    # Строка с тем же ключом перезаписывается на месте (rowid и порядок сохраняются)
+    return (f"INSERT INTO results ({', '.join(_q(c) for c in INSERT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))}) ON CONFLICT (wave, row_key) DO UPDATE SET "
+            + ", ".join(f"{_q(c)} = excluded.{_q(c)}" for c in INSERT_COLUMNS if c not in ("wave", "row_key")))
+
+def _records(df, upload_id, wave, source=None, keys=None, fingerprints=None):
+    """Строки таблицы как кортежи значений Python в порядке INSERT_COLUMNS"""
+    masks = df.attrs.get("coerced_rows")
+    columns = [repeat(source), repeat(None) if keys is None else keys,
+               repeat(None) if fingerprints is None else fingerprints,
+               repeat(None) if masks is None else masks.tolist()]
+    for name in STORE_COLUMNS:
+        if name not in df.columns:
+            columns.append(repeat(None, len(df)))
+            continue
+        s = df[name]
+        if s.dtype == np.float32:
+            s = pd.Series(widen_float32(s.to_numpy()), index=s.index)
+        values = s.astype(object).to_numpy()
+        missing = pd.isna(values)
+        if _column_type(name) == "TEXT":
+            values = np.array([str(v) for v in values], dtype=object)
+        values[missing] = None
+        columns.append(values)
+    return zip(repeat(upload_id), repeat(wave), *columns)
+
+def _write_rows(conn, wave, keys, records):
+    """Записывает строки волны (upsert по ключам keys) и переносит их вклад в totals"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS written (row_key TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM written")
+    conn.executemany("INSERT OR IGNORE INTO written VALUES (?)", ((key,) for key in keys))
+    subset, params = "wave = ? AND row_key IN (SELECT row_key FROM written)", [wave]
+    _bump(conn, subset, params, -1)
+    conn.executemany(_insert_sql(), records)
+    _bump(conn, subset, params, 1)
+
+def _upload_id(conn, digest, wave, filename):
+    """Запись о загрузке (файл + волна): существующая обновляется, иначе создается"""
+    row = conn.execute("SELECT id FROM uploads WHERE digest = ? AND wave = ?", (digest, wave)).fetchone()
+    if row is not None:
+        conn.execute("UPDATE uploads SET filename = ?, scoring_version = ?, created = ? WHERE id = ?",
+                     (filename, SCORING_VERSION, time.time(), row["id"]))
+        return row["id"]
+    return conn.execute(
+        "INSERT INTO uploads (digest, wave, filename, scoring_version, created) VALUES (?, ?, ?, ?, ?)",
+        (digest, wave, filename, SCORING_VERSION, time.time()),
+    ).lastrowid
+
+def _finish_upload(conn, upload_id):
+    """
+    Число строк загрузки; прежние загрузки, все строки которых заменены более новыми,
+    удаляются. Текущая остается и без строк (sync_export без изменений): повторное
+    сохранение того же файла тогда ничего не пишет.
+    """
+    conn.execute("UPDATE uploads SET rows = (SELECT COUNT(*) FROM results WHERE upload = ?) WHERE id = ?",
+                 (upload_id, upload_id))
+    conn.execute("DELETE FROM uploads WHERE id != ? AND NOT EXISTS "
+                 "(SELECT 1 FROM results WHERE results.upload = uploads.id)", (upload_id,))
+
+def _saved_upload(conn, digest, wave):
+    """id загрузки, если файл уже сохранен в волне целиком текущей версией расчетов, иначе None"""
+    row = conn.execute("SELECT id, scoring_version, rows FROM uploads WHERE digest = ? AND wave = ?",
+                       (digest, wave)).fetchone()
+    if (row is not None and row["scoring_version"] == SCORING_VERSION and row["rows"] ==
+            conn.execute("SELECT COUNT(*) FROM results WHERE upload = ?", (row["id"],)).fetchone()[0]):
+        return row["id"]
+    return None
+
+def save_frames(digest, filename, frames, wave, source=None):
+    """
+    Сохраняет посчитанную таблицу (по кускам frames) как загрузку волны wave,
+    source - имя выгрузки (по умолчанию из имени файла). Тот же файл в той же волне
+    повторно не пишется, пока его строки целы (и не менялась версия расчетов).
+    Возвращает id загрузки.
+    """
+    source = source or source_name(filename)
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            saved = _saved_upload(conn, digest, wave)
+            if saved is not None:
+                conn.execute("ROLLBACK")
+                return saved
+            upload_id = _upload_id(conn, digest, wave, filename)
+            # Строки прежнего сохранения этого файла (другая версия расчетов - другие отпечатки)
+            _delete_rows(conn, "upload = ?", [upload_id])
+            for df in frames:
+                # Отпечаток исходных ячеек здесь неизвестен: sync_export такие строки пересчитает
+                keys = row_keys(df)
+                _write_rows(conn, wave, keys, _records(df, upload_id, wave, source, keys))
+            _finish_upload(conn, upload_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return upload_id
+
+def save_upload(file_storage, frames, wave=None, half=None):
+    """
+    Сохраняет результат process_dataframe (таблицу или куски) по загруженному файлу.
+    Волна - явная или по датам в первом куске; возвращает волну или None,
+    если ее не удалось определить (тогда таблица не сохраняется).
+    """
+    frames = iter([frames] if isinstance(frames, pd.DataFrame) else frames)
+    first = next(frames, None)
+    if first is None:
+        return None
+    digest = file_digest(file_storage)
+    inferred = wave is None
+    wave = wave or infer_wave(first, half)
+    if wave is None:
+        return None
+    save_frames(digest, getattr(file_storage, "filename", None), chain([first], frames), wave)
+    if inferred:
+        # Волна по датам запоминается: save_file найдет сохраненный файл без разбора
+        with closing(_connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO inferred_waves (digest, half, wave) VALUES (?, ?, ?)",
+                         (digest, half or "", wave))
+    return wave
+
+def save_file(file_storage, wave=None, half=None):
+    """
+    То же, что save_upload, но по самому файлу: для ответа из кэша готовых отчетов,
+    когда таблица не считалась. Уже сохраненный в волне файл не разбирается повторно.
+    Возвращает волну или None.
+    """
+    digest = file_digest(file_storage)
+    with closing(_connect()) as conn:
+        known = wave
+        if known is None:
+            row = conn.execute("SELECT wave FROM inferred_waves WHERE digest = ? AND half = ?",
+                               (digest, half or "")).fetchone()
+            known = row and row["wave"]
+        if known is not None and _saved_upload(conn, digest, known) is not None:
+            return known
+    frames = iter_scored_chunks(file_storage) if is_large_csv(file_storage) else process_dataframe(file_storage)
+    return save_upload(file_storage, frames, wave, half)
+
+# --- ЗАПРОСЫ ---
+
+def _where(wave=None, organization=None, age=None, source=None):
+    clauses, params = [], []
+    for column, value in (("wave", wave), ("Организация", organization), ("Возраст", age), ("source", source)):
+        if value not in (None, ""):
+            clauses.append(f"{_q(column)} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _select(columns, wave, organization=None, age=None, source=None):
+    columns = list(columns or STORE_COLUMNS)
+    unknown = [c for c in columns if c not in STORE_COLUMNS]
+    if unknown:
+        raise ValueError("Неизвестные колонки: " + ", ".join(unknown))
+    where, params = _where(wave, organization, age, source)
+    # Порядок вставки: индекс по волне иначе отдал бы строки по организациям
+    return columns, f"SELECT {', '.join(_q(c) for c in columns)} FROM results{where} ORDER BY rowid", params
+
+def load_frame(wave, organization=None, age=None, columns=None, source=None):
+    """
+    Сохраненные строки волны (с отбором по организации, возрасту, выгрузке) в том же
+    виде, что отдает process_dataframe: уровни и категории восстанавливаются.
+    """
+    columns, sql, params = _select(columns, wave, organization, age, source)
+    with closing(_connect()) as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    return _restore(df)
+
+def iter_frames(wave, source=None, columns=None, chunk_rows=CHUNK_ROWS):
+    """То же, что load_frame, кусками по chunk_rows строк (для листа Полные_данные)"""
+    columns, sql, params = _select(columns, wave, source=source)
+    with closing(_connect()) as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield _restore(pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns))
+
+def _restore(df):
+    """Типы как у process_dataframe"""
+    for col in df.columns:
+        # Пустая колонка читается как object - числовые делаем числами
+        if _column_type(col) != "TEXT" and df[col].dtype == object:
+            df[col] = pd.to_numeric(df[col])
+    df = compact_frame(df)
+    for col in LEVEL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(level_dtype())
+    return df
+
+def waves():
+    """Что сохранено: по волнам и организациям - число детей и загрузок"""
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            'SELECT wave, "Организация" AS organization, COUNT(*) AS children, COUNT(DISTINCT upload) AS uploads '
+            'FROM results GROUP BY wave, "Организация" ORDER BY wave, "Организация"'
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def summary(wave=None, organization=None, age=None, by=("Организация",)):
+    """
+    Распределение уровней по показателям в разрезе by (wave, Организация, Возраст):
+    строки вида {разрезы..., "Детей": n, "показатель: уровень": число}, как в сводке пакета.
+    """
+    by = list(by)
+    bad = [g for g in by if g not in SUMMARY_GROUPS]
+    if bad:
+        raise ValueError("Неизвестный разрез: " + ", ".join(bad))
+    counts = [(f"{metric}: {level}", f'SUM({_q(metric + "_уровень")} = ?)')
+              for metric in SCORED_METRICS for level in LEVELS]
+    select = [_q(g) for g in by] + ['COUNT(*)'] + [expr for _, expr in counts]
+    where, params = _where(wave, organization, age)
+    sql = f"SELECT {', '.join(select)} FROM results{where}"
+    if by:
+        sql += f" GROUP BY {', '.join(_q(g) for g in by)} ORDER BY {', '.join(_q(g) for g in by)}"
+    level_params = [level for _ in SCORED_METRICS for level in LEVELS]
+    with closing(_connect()) as conn:
+        rows = conn.execute(sql, level_params + params).fetchall()
+    out = []
+    for row in rows:
+        values = list(row)
+        entry = dict(zip(by, values[:len(by)]))
+        entry["Детей"] = values[len(by)]
+        entry.update((name, int(v or 0)) for (name, _), v in zip(counts, values[len(by) + 1:]))
+        out.append(entry)
+    return out
+
+def aggregates(wave, source=None):
+    """
+    Итоги для сводных листов Excel-отчета из totals, без чтения строк:
+    {"rows", "ages": {возраст: n} по убыванию, "levels": {показатель: {уровень: n}}, "coerced": {колонка: n}}.
+    """
+    where, params = _where(wave, source=source)
+    with closing(_connect()) as conn:
+        items = conn.execute(f"SELECT kind, name, SUM(n) FROM totals{where} GROUP BY kind, name "
+                             f"HAVING SUM(n) != 0 ORDER BY MIN(rowid)", params).fetchall()
+    out = {"rows": 0, "ages": {}, "levels": {metric: dict.fromkeys(LEVELS, 0) for metric in SCORED_METRICS},
+           "coerced": {}}
+    for kind, name, n in items:
+        if kind == "rows":
+            out["rows"] = n
+        elif kind == "age":
+            out["ages"][name] = n
+        elif kind == "level":
+            metric, level = name.split(": ", 1)
+            if metric in out["levels"] and level in out["levels"][metric]:
+                out["levels"][metric][level] = n
+        elif kind == "coerced":
+            out["coerced"][name] = n
+    # Равные по числу возрасты остаются в порядке первого появления
+    out["ages"] = dict(sorted(out["ages"].items(), key=lambda item: -item[1]))
+    return out
+
+# --- ИНКРЕМЕНТАЛЬНАЯ ОБРАБОТКА РАСТУЩЕЙ ВЫГРУЗКИ ---
+# Выгрузка анкеты растет по мере ответов, а пересчитывать ее целиком несколько раз
+# в день незачем. Строка выгрузки определяется ключом row_keys в пределах волны;
+# отпечаток исходных ячеек показывает, менялась ли строка. Считаются только новые
+# и измененные строки, строки выгрузки, которых в файле больше нет, удаляются,
+# итоги в totals меняются на вклад этих строк. Отпечаток включает версию
+# расчетов: после ее смены пересчитывается все.
+
+def sync_export(file_storage, wave=None, source=None):
+    """
+    Сливает выгрузку с сохраненными результатами: считает только новые и
+    измененные строки. Волна - явная или по датам в файле, source - имя выгрузки
+    (по умолчанию из имени файла). Возвращает {"wave", "source", "rows", "scored",
+    "deleted", "columns"}; columns - колонки посчитанной таблицы в порядке файла.
+    """
+    filename = getattr(file_storage, "filename", None)
+    source = source or source_name(filename)
+    digest = file_digest(file_storage)
+    frames = iter_upload_frames(file_storage)
+    stats = {"source": source, "rows": 0, "scored": 0, "deleted": 0}
+
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (row_key TEXT PRIMARY KEY)")
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (pos INTEGER PRIMARY KEY, row_key TEXT, fingerprint TEXT)")
+            conn.execute("DELETE FROM seen")
+            upload_id = None
+            for raw in frames:
+                raw.columns = raw.columns.str.strip()
+                raw = raw.rename(columns=COLUMN_MAPPING).reset_index(drop=True)
+                if upload_id is None:
+                    wave = wave or infer_wave(raw)
+                    if wave is None:
+                        raise ValueError("Не удалось определить волну по колонке Время - укажите ее явно")
+                    upload_id = _upload_id(conn, digest, wave, filename)
+                    # Порядок колонок отчета как у process_dataframe (по заголовкам файла)
+                    stats["columns"] = list(score_frame(raw.iloc[:1].copy()).columns)
+
+                fingerprints = row_fingerprints(raw)
+                keys = row_keys(raw, fingerprints)
+                # Повтор ключа внутри выгрузки: действует последняя строка
+                last = pd.Series(range(len(keys))).groupby(keys, sort=False).last().to_numpy()
+                conn.execute("DELETE FROM incoming")
+                conn.executemany("INSERT INTO incoming VALUES (?, ?, ?)",
+                                 ((int(i), keys[i], fingerprints[i]) for i in last))
+                conn.execute("INSERT OR IGNORE INTO seen SELECT row_key FROM incoming")
+                # Новые и измененные строки - одним запросом по уникальному индексу
+                changed = [row[0] for row in conn.execute(
+                    "SELECT i.pos FROM incoming i LEFT JOIN results r ON r.wave = ? AND r.row_key = i.row_key "
+                    "WHERE r.fingerprint IS NOT i.fingerprint OR r.source IS NOT ? ORDER BY i.pos", (wave, source))]
+                if not changed:
+                    continue
+                with stage("score", rows=len(changed)):
+                    scored = score_frame(raw.iloc[changed].reset_index(drop=True), row_masks=True)
+                changed_keys = [keys[i] for i in changed]
+                _write_rows(conn, wave, changed_keys, _records(
+                    scored, upload_id, wave, source, changed_keys, [fingerprints[i] for i in changed]))
+                stats["scored"] += len(changed)
+
+            if upload_id is None:
+                raise ValueError("Файл пустой")
+            # Ключ может повториться в разных кусках - строк столько, сколько разных ключей
+            stats["rows"] = conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+            stats["deleted"] = _delete_rows(
+                conn, "source = ? AND wave = ? AND row_key NOT IN (SELECT row_key FROM seen)", [source, wave])
+            _finish_upload(conn, upload_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    stats["wave"] = wave
+    return stats
@@ -1,6 +1,15 @@
-import pandas as pd
 import re
-import io
+import os
+import copy
+import functools
+from api.cache import FRAME_CACHE, env_int, file_digest, make_key
+from api.instrument import stage
+from api.lazy import LazyModule
+from api.metrics import MetricGraph
+from api.readers import SNIFF_BYTES, read_csv_chunks, read_table, sniff_format, upload_stream
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
 
 # --- МЭППИНГ КОЛОНОК ---
 COLUMN_MAPPING = {
@@ -45,6 +54,10 @@ COLUMN_MAPPING = {
     'Методика наблюдения за совместной деятельностью. Укажите средние значения результатов экспертного наблюдения по видам деятельности / Рефлексия': "Рефлек"
 }
 
+# Версия формул и норм: меняется при любом изменении расчетов,
+# чтобы кэш не отдавал результаты, посчитанные по-старому
+SCORING_VERSION = "2"
+
 # --- НОРМЫ ПО ВОЗРАСТАМ ---
 # Ключ: возраст (начало интервала). Например, 3 -> "3-4 года"
 AGE_NORMS = {
@@ -94,22 +107,31 @@ def calc_lab(time, errors, reached, limit):
 def attention_index(rings, errors):
     return 0.5 * to_float(rings) - (2.8 * to_float(errors)) / 60
 
-def categorize_by_age(value, age_str):
+@functools.lru_cache(maxsize=1024)
+def age_norm(age_str):
     """
-    Определяет уровень с учетом возраста ребенка.
-    Если возраст не распознан, используется дефолтная норма.
+    Пороги нормы для строки возраста. Разных строк в файле единицы,
+    поэтому результат запоминается: regex выполняется один раз на строку.
     """
-    if pd.isna(value): return "ниже нормативного"
-    
     age = get_age_from_string(age_str)
-    
+
     # Получаем пороговые значения (если возраст < 2 или > 7, берем ближайшие или дефолт)
     # Здесь простая логика: ищем точное совпадение ключа
     thresholds = AGE_NORMS.get(age, DEFAULT_NORM)
-    
+
     # Если возраст больше 7, применяем самую строгую норму (как для 7)
     if age > 7:
         thresholds = AGE_NORMS[7]
+    return thresholds
+
+def categorize_by_age(value, age_str):
+    """
+    Определяет уровень с учетом возраста ребенка.
+    Если возраст не распознан, используется дефолтная норма.
+    """
+    if pd.isna(value): return "ниже нормативного"
+    
+    thresholds = age_norm(age_str)
     
     if value < thresholds['low']:
         return "ниже нормативного"
@@ -118,70 +140,397 @@ def categorize_by_age(value, age_str):
     else:
         return "выше нормативного"
 
-def process_dataframe(file_storage):
+# --- ВЕКТОРНЫЕ ВЕРСИИ РАСЧЕТОВ ---
+# Те же формулы, что и в calc_lab / attention_index / categorize_by_age,
+# но над целыми колонками: без вызова Python-функции на каждую строку.
+
+LEVELS = ["ниже нормативного", "нормативный", "выше нормативного"]
+
+# Лимит времени (в секундах) для каждого лабиринта И5-1..И5-5
+LAB_LIMITS = {1: 35, 2: 35, 3: 50, 4: 65, 5: 125}
+
+def _num(col):
+    """
+    Колонка -> массив float по правилам to_float: десятичная запятая -> точка,
+    пробелы убираются, нечисловое и пропуски -> 0. После clean_numeric колонки
+    уже числовые, и разбор строк не нужен.
+    """
+    values = pd.to_numeric(col, errors="coerce")
+    if col.dtype == object:
+        retry = values.isna() & col.notna()
+        if retry.any():
+            text = col[retry].astype(str).str.replace(",", ".", regex=False).str.replace(" ", "", regex=False).str.strip()
+            values = values.astype(float)
+            values[retry] = pd.to_numeric(text, errors="coerce")
+    return values.fillna(0).to_numpy(dtype=float)
+
+def calc_lab_vec(time, errors, reached, limit):
+    """Векторный calc_lab: баллы за лабиринт для всей колонки"""
+    time = _num(time)
+    errors = _num(errors)
+    # to_int: отбрасываем дробную часть, бесконечность -> 0
+    errors = np.where(np.isfinite(errors), np.trunc(errors), 0)
+    if reached.dtype == object:
+        not_reached = reached.str.strip().str.lower().eq("нет").fillna(False).to_numpy(dtype=bool)
+    else:
+        not_reached = np.zeros(len(reached), dtype=bool)
+    return np.select(
+        [not_reached | (time > limit), errors == 0, errors == 1, (errors >= 2) & (errors <= 5)],
+        [0, 3, 2, 1],
+        default=0,
+    )
+
+def attention_index_vec(rings, errors):
+    """Векторный attention_index"""
+    return 0.5 * _num(rings) - (2.8 * _num(errors)) / 60
+
+def age_thresholds(ages):
+    """
+    Колонка возрастов -> массивы нижних и верхних порогов нормы.
+    Нормы определяются по уникальным значениям (age_norm), строки получают их по коду значения.
+    """
+    if isinstance(ages.dtype, pd.CategoricalDtype):
+        codes, uniques = ages.cat.codes.to_numpy(), ages.cat.categories
+    else:
+        codes, uniques = pd.factorize(ages)
+    # Последняя строка таблицы - дефолтная норма для пропусков (код -1)
+    norms = [age_norm(value) for value in uniques] + [DEFAULT_NORM]
+    table = np.array([(n['low'], n['high']) for n in norms], dtype=float)[codes]
+    return table[:, 0], table[:, 1]
+
+def categorize_levels(values, ages):
+    """
+    Уровни сразу для нескольких колонок показателей (DataFrame): пороги по возрасту
+    находятся один раз и сравниваются со всеми колонками одной операцией.
+    Возвращает список категорий с упорядоченными уровнями LEVELS, по колонке на показатель.
+    """
+    low, high = age_thresholds(ages)
+    values = values.to_numpy(dtype=float).reshape(len(low), -1)
+    below = np.isnan(values) | (values < low[:, None])
+    codes = np.where(below, 0, np.where(values <= high[:, None], 1, 2)).astype(np.int8)
+    return [pd.Categorical.from_codes(codes[:, i], dtype=level_dtype()) for i in range(codes.shape[1])]
+
+def categorize_by_age_vec(values, ages):
+    """
+    Векторный categorize_by_age: уровни для всей колонки с учетом возраста.
+    Результат - категория с упорядоченными уровнями LEVELS (коды 0/1/2, без строк на каждую ячейку).
+    """
+    return categorize_levels(values, ages)[0]
+
+def level_dtype():
+    """Тип колонок *_уровень: категория с порядком ниже < нормативный < выше"""
+    return pd.CategoricalDtype(LEVELS, ordered=True)
+
+# --- ОЧИСТКА ЧИСЛОВЫХ ДАННЫХ ---
+
+# Колонки, которые остаются текстом и не проходят через очистку чисел
+TEXT_COLUMNS = ["ID", "Время", "Организация", "Код", "Возраст"]
+
+# Колонки листа качества данных (в колонках «Дошел» да/нет - не ошибка) и их биты в масках строк
+QUALITY_COLUMNS = [c for c in dict.fromkeys(COLUMN_MAPPING.values()) if c not in TEXT_COLUMNS and not c.endswith("Дошел")]
+QUALITY_BITS = {col: i for i, col in enumerate(QUALITY_COLUMNS)}
+
+def clean_numeric(df, cols, row_masks=False):
+    """
+    Приводит колонки к числам разом (семантика to_float, но без вызова на каждую ячейку):
+    десятичная запятая -> точка, пробелы убираются, пропуски и нераспознанное -> 0.
+    Возвращает {колонка: сколько непустых ячеек пришлось заменить нулем}.
+    row_masks - еще и по строкам: df.attrs["coerced_rows"], бит i - замена в QUALITY_COLUMNS[i].
+    """
+    coerced = {}
+    if row_masks:
+        df.attrs["coerced_rows"] = np.zeros(len(df), dtype=np.int64)
+    # Уже числовые колонки: достаточно заменить пропуски
+    obj_cols = []
+    for col in cols:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(0)
+        else:
+            obj_cols.append(col)
+    if not obj_cols:
+        return coerced
+
+    # Все остальные ячейки - одним плоским столбцом. Разных значений в анкетах
+    # немного (баллы, да/нет, пара опечаток): каждое разбирается один раз,
+    # ячейки получают результат по коду значения (factorize)
+    n_rows = len(df)
+    codes, uniques = pd.factorize(df[obj_cols].astype(object).to_numpy().ravel(order="F"))
+    uniques = pd.Series(uniques, dtype=object)
+    blank = (uniques == "").to_numpy()
+    parsed = pd.to_numeric(uniques, errors="coerce").astype(float)
+    retry = parsed.isna().to_numpy() & ~blank
+    if retry.any():
+        text = uniques[retry].astype(str).str.replace(",", ".", regex=False).str.replace(r"\s+", "", regex=True)
+        parsed[retry] = pd.to_numeric(text, errors="coerce")
+    # Пропуски (None, NaN) получают код -1 - последний элемент: 0 и не ошибка
+    lookup = np.append(parsed.fillna(0).to_numpy(dtype=float), 0.0)
+    unique_bad = np.append(parsed.isna().to_numpy() & ~blank, False)
+    values = lookup[codes].reshape((n_rows, len(obj_cols)), order="F")
+    bad_cells = unique_bad[codes].reshape((n_rows, len(obj_cols)), order="F")
+    bad = bad_cells.sum(axis=0)
+    if row_masks:
+        for i, col in enumerate(obj_cols):
+            if col in QUALITY_BITS:
+                df.attrs["coerced_rows"] |= bad_cells[:, i].astype(np.int64) << QUALITY_BITS[col]
+
+    for i, col in enumerate(obj_cols):
+        df[col] = values[:, i]
+        # В колонках «Дошел» ответы да/нет, а не числа - это не ошибка данных
+        if bad[i] and not col.endswith("Дошел"):
+            coerced[col] = int(bad[i])
+    return coerced
+
+# --- ГРАФ РАСЧЕТА МЕТРИК ---
+# Формулы score_frame: каждая расчетная колонка - узел графа со своими входами.
+# Новая метрика - один новый узел; порядок узлов - порядок колонок в отчете.
+
+SCORING = MetricGraph()
+
+# Итоговые показатели и их уровни - то, что нужно отчетам сравнения
+SCORED_METRICS = ["Когнитивное развитие", "Воображение_итог", "ЭмСоцИнтеллект"]
+LEVEL_COLUMNS = [f"{col}_уровень" for col in SCORED_METRICS]
+
+def _ratio(name, source, scale):
+    """Узел «балл / максимум шкалы», округленный до сотых"""
+    SCORING.add(name, [source], lambda df: (df[source] / scale).round(2))
+
+def _alias(name, source):
+    """Узел-синоним: та же колонка под именем, которое ждет отчет"""
+    SCORING.add(name, [source], lambda df: df[source])
+
+for _i, _limit in LAB_LIMITS.items():
+    SCORING.add(f"П{_i}", [f"И5-{_i}Время", f"И5-{_i}Ошиб", f"И5-{_i}Дошел"],
+                lambda df, i=_i, limit=_limit: calc_lab_vec(df[f"И5-{i}Время"], df[f"И5-{i}Ошиб"], df[f"И5-{i}Дошел"], limit))
+
+LAB_SCORES = [f"П{i}" for i in LAB_LIMITS]
+SCORING.add("Аналит-Синт", LAB_SCORES, lambda df: ((df[LAB_SCORES].mean(axis=1)) / 3).round(2))
+
+for _i in range(1, 6):
+    SCORING.add(f"Вним{_i}", [f"И3-{_i}Кольца", f"И3-{_i}Ошиб"],
+                lambda df, i=_i: attention_index_vec(df[f"И3-{i}Кольца"], df[f"И3-{i}Ошиб"]))
+
+ATTENTION_SCORES = [f"Вним{i}" for i in range(1, 6)]
+SCORING.add("СредВним", ATTENTION_SCORES, lambda df: df[ATTENTION_SCORES].mean(axis=1))
+SCORING.add("Качество внимания", ["СредВним"],
+            lambda df: np.where(df["СредВним"] >= 6, 1, (df["СредВним"] / 6).round(2)))
+
+_ratio("Связн", "И1-2Связн", 5)
+_ratio("РечОформ", "И1-2РечОформ", 5)
+_ratio("СамостРасс", "И1-2СамРасс", 5)
+
+@SCORING.node("Готовн_УД", "И1-1Сум", "Связн", "РечОформ", "СамостРасс")
+def _readiness(df):
+    return ((df["И1-1Сум"] / 18 + (df["Связн"] + df["РечОформ"] + df["СамостРасс"]) / 3) / 2).round(2)
+
+_ratio("Лог_обобщение", "И2Сум", 16)
+_ratio("Перцепция", "И4Сум", 11)
+_alias("Активн_вниман", "Качество внимания")
+_alias("Аналит_синт", "Аналит-Синт")
+
+@SCORING.node("Воображение", "В1", "В2")
+def _imagination(df):
+    return (((df["В1"] / 3) + (df["В2"] / 3)) / 2).round(2)
+
+_ratio("Идентиф_эмоций", "ЭмоцИдент", 8)
+_ratio("Планирование", "Планир", 4)
+_ratio("Сотрудничество", "Сотруд", 4)
+_ratio("Рефлексия", "Рефлек", 4)
+
+@SCORING.node("Когнитивное развитие", "Готовн_УД", "Активн_вниман", "Аналит_синт", "Лог_обобщение", "Перцепция")
+def _cognitive(df):
+    return ((df["Готовн_УД"] + df["Активн_вниман"] + df["Аналит_синт"] + df["Лог_обобщение"] + df["Перцепция"]) / 5).round(2)
+
+_alias("Воображение_итог", "Воображение")
+
+@SCORING.node("ЭмСоцИнтеллект", "Идентиф_эмоций", "Планирование", "Сотрудничество", "Рефлексия")
+def _emotional(df):
+    return ((df["Идентиф_эмоций"] + (df["Планирование"] + df["Сотрудничество"] + df["Рефлексия"]) / 3) / 2).round(2)
+
+# --- ПРИМЕНЕНИЕ НОВЫХ НОРМ С УЧЕТОМ ВОЗРАСТА ---
+# Пороги берутся по строке возраста из этой же строки (см. categorize_by_age);
+# все три уровня - один узел: пороги находятся один раз на таблицу
+SCORING.add(LEVEL_COLUMNS, SCORED_METRICS + ["Возраст"],
+            lambda df: categorize_levels(df[SCORED_METRICS], df["Возраст"]))
+
+def score_sources(outputs):
+    """Колонки файла (имена после COLUMN_MAPPING), нужные для outputs"""
+    known = set(COLUMN_MAPPING.values())
+    unknown = [name for name in outputs if name not in SCORING.nodes and name not in known]
+    if unknown:
+        raise ValueError("Неизвестные колонки: " + ", ".join(unknown))
+    return SCORING.sources(outputs)
+
+def process_dataframe(file_storage, outputs=None):
     """
     Основная функция обработки. Читает файл, чистит данные, считает баллы
     и проставляет уровни с учетом возраста.
+    outputs - нужные колонки (например, LEVEL_COLUMNS): из файла читаются и
+    считаются только они и то, от чего они зависят. None - вся таблица.
+    Результат кэшируется по содержимому файла: повторная загрузка не пересчитывается.
+    """
+    if outputs is not None:
+        outputs = list(outputs)
+        score_sources(outputs)  # неизвестные колонки - ошибка до чтения файла
+    filename = getattr(file_storage, "filename", None)
+    ext = os.path.splitext(filename or "")[1].lower()
+    key = make_key(file_digest(file_storage), ext, SCORING_VERSION, *(outputs or ()))
+    cached = FRAME_CACHE.get(key)
+    if cached is not None:
+        return _detached(cached)
+
+    if outputs is None:
+        columns = COLUMN_MAPPING.keys()
+    else:
+        sources = set(score_sources(outputs))
+        columns = [raw for raw, name in COLUMN_MAPPING.items() if name in sources]
+    # Берем только колонки из COLUMN_MAPPING, остальные в расчетах не участвуют
+    df = read_upload(file_storage, columns)
+
+    with stage("score", rows=len(df)):
+        df = score_frame(df, outputs)
+    FRAME_CACHE.put(key, df)
+    return _detached(df)
+
+def read_upload(file_storage, columns=None):
+    """
+    Читает загрузку в DataFrame без расчетов (columns - нужные заголовки файла).
+    Парсер читает прямо из загруженного потока (без read() в память).
     """
-    file_content = file_storage.read()
-    file_io = io.BytesIO(file_content)
-    
     try:
-        df = pd.read_excel(file_io, sheet_name=0)
-    except:
-        file_io.seek(0)
+        with stage("read") as st:
+            df = read_table(upload_stream(file_storage), getattr(file_storage, "filename", None), columns=columns)
+            st.rows = len(df)
+    except Exception as e:
+        raise ValueError(f"Ошибка формата файла: {e}")
+    return df
+
+# --- ПОТОКОВАЯ ОБРАБОТКА БОЛЬШИХ CSV ---
+# Файл не читается в память целиком: строки считаются кусками по CHUNK_ROWS,
+# в памяти одновременно только один кусок.
+
+CHUNK_ROWS = env_int("KIDSKI_CHUNK_ROWS", 50000)
+CHUNKED_MIN_BYTES = env_int("KIDSKI_CHUNKED_MB", 32) * 1024 * 1024
+
+def is_large_csv(file_storage, min_bytes=CHUNKED_MIN_BYTES):
+    """CSV-файл, который стоит обрабатывать кусками (iter_scored_chunks)"""
+    stream = upload_stream(file_storage)
+    size = stream.seek(0, 2)
+    stream.seek(0)
+    if size < min_bytes:
+        return False
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    return sniff_format(head, getattr(file_storage, "filename", None)) == "csv"
+
+def iter_scored_chunks(file_storage, chunk_rows=CHUNK_ROWS):
+    """
+    Читает CSV кусками и считает каждый кусок теми же формулами (score_frame).
+    Кэш таблиц не используется: результат может не поместиться в память.
+    """
+    for chunk in read_chunks(file_storage, chunk_rows):
+        with stage("score", rows=len(chunk)):
+            chunk = score_frame(chunk)
+        yield chunk
+
+def iter_upload_frames(file_storage):
+    """Загрузка без расчетов (колонки COLUMN_MAPPING): большой CSV - кусками, остальное - целиком"""
+    if is_large_csv(file_storage):
+        yield from read_chunks(file_storage)
+    else:
+        yield read_upload(file_storage, COLUMN_MAPPING.keys())
+
+def read_chunks(file_storage, chunk_rows=CHUNK_ROWS):
+    """Куски CSV (колонки COLUMN_MAPPING) без расчетов"""
+    stream = upload_stream(file_storage)
+    head = stream.read(SNIFF_BYTES)
+    # Текстовые колонки - текстом во всех кусках (ID оставляем числом, как при чтении целиком)
+    text_columns = [raw for raw, name in COLUMN_MAPPING.items() if name in TEXT_COLUMNS and name != "ID"]
+    chunks = read_csv_chunks(stream, head, COLUMN_MAPPING.keys(), chunk_rows, text_columns)
+    while True:
         try:
-            df = pd.read_csv(file_io, sep=None, engine='python')
+            with stage("read") as st:
+                chunk = next(chunks, None)
+                st.rows = 0 if chunk is None else len(chunk)
         except Exception as e:
             raise ValueError(f"Ошибка формата файла: {e}")
+        if chunk is None:
+            return
+        yield chunk
+
+def _detached(df):
+    """Копия для вызывающего кода, чтобы изменения не портили запись в кэше"""
+    out = df.copy()
+    out.attrs = copy.deepcopy(df.attrs)
+    return out
+
+def score_frame(df, outputs=None, row_masks=False):
+    """
+    Переименовывает колонки прочитанной таблицы, чистит числа, считает баллы
+    и уровни. Используется и для целого файла, и для отдельных кусков.
+    outputs - нужные колонки результата (None - вся таблица со всеми метриками).
+    row_masks - отметить замененные ячейки по строкам (см. clean_numeric).
+    """
+    df = prepare_frame(df, outputs, row_masks)
+
+    # --- РАСЧЕТ МЕТРИК (только узлы графа, нужные для outputs) ---
+    SCORING.compute(df, outputs)
+    if outputs is not None:
+        df = df[list(outputs)]
+
+    return compact_frame(df)
 
+def prepare_frame(df, outputs=None, row_masks=False):
+    """Первый шаг score_frame: имена колонок по COLUMN_MAPPING, недостающие - нулями, очистка чисел"""
     df.columns = df.columns.str.strip()
     df = df.rename(columns=COLUMN_MAPPING)
 
     # Заполнение пропусков нулями для расчетных колонок
-    for col in COLUMN_MAPPING.values():
+    for col in COLUMN_MAPPING.values() if outputs is None else score_sources(outputs):
         if col not in df.columns: df[col] = 0
 
-    # Очистка числовых данных
-    numeric_cols = [c for c in df.columns if c not in ["ID", "Организация", "Код", "Возраст"]]
-    for col in numeric_cols:
-        df[col] = df[col].apply(to_float)
-
-    # --- РАСЧЕТ МЕТРИК ---
-    df["П1"] = df.apply(lambda x: calc_lab(x.get("И5-1Время"), x.get("И5-1Ошиб"), x.get("И5-1Дошел"), 35), axis=1)
-    df["П2"] = df.apply(lambda x: calc_lab(x.get("И5-2Время"), x.get("И5-2Ошиб"), x.get("И5-2Дошел"), 35), axis=1)
-    df["П3"] = df.apply(lambda x: calc_lab(x.get("И5-3Время"), x.get("И5-3Ошиб"), x.get("И5-3Дошел"), 50), axis=1)
-    df["П4"] = df.apply(lambda x: calc_lab(x.get("И5-4Время"), x.get("И5-4Ошиб"), x.get("И5-4Дошел"), 65), axis=1)
-    df["П5"] = df.apply(lambda x: calc_lab(x.get("И5-5Время"), x.get("И5-5Ошиб"), x.get("И5-5Дошел"), 125), axis=1)
-    df["Аналит-Синт"] = ((df[["П1", "П2", "П3", "П4", "П5"]].mean(axis=1)) / 3).round(2)
-
-    for i in range(1, 6):
-        df[f"Вним{i}"] = df.apply(lambda x: attention_index(x.get(f"И3-{i}Кольца"), x.get(f"И3-{i}Ошиб")), axis=1)
-    df["СредВним"] = df[[f"Вним{i}" for i in range(1, 6)]].mean(axis=1)
-    df["Качество внимания"] = df["СредВним"].apply(lambda v: 1 if v >= 6 else round(v / 6, 2))
-
-    df["Связн"] = (df["И1-2Связн"] / 5).round(2)
-    df["РечОформ"] = (df["И1-2РечОформ"] / 5).round(2)
-    df["СамостРасс"] = (df["И1-2СамРасс"] / 5).round(2)
-    df["Готовн_УД"] = ((df["И1-1Сум"] / 18 + (df["Связн"] + df["РечОформ"] + df["СамостРасс"]) / 3) / 2).round(2)
-    
-    df["Лог_обобщение"] = (df["И2Сум"] / 16).round(2)
-    df["Перцепция"] = (df["И4Сум"] / 11).round(2)
-    df["Активн_вниман"] = df["Качество внимания"]
-    df["Аналит_синт"] = df["Аналит-Синт"]
-    df["Воображение"] = (((df["В1"] / 3) + (df["В2"] / 3)) / 2).round(2)
-    df["Идентиф_эмоций"] = (df["ЭмоцИдент"] / 8).round(2)
-    df["Планирование"] = (df["Планир"] / 4).round(2)
-    df["Сотрудничество"] = (df["Сотруд"] / 4).round(2)
-    df["Рефлексия"] = (df["Рефлек"] / 4).round(2)
-
-    df["Когнитивное развитие"] = ((df["Готовн_УД"] + df["Активн_вниман"] + df["Аналит_синт"] + df["Лог_обобщение"] + df["Перцепция"]) / 5).round(2)
-    df["Воображение_итог"] = df["Воображение"]
-    df["ЭмСоцИнтеллект"] = ((df["Идентиф_эмоций"] + (df["Планирование"] + df["Сотрудничество"] + df["Рефлексия"]) / 3) / 2).round(2)
-
-    # --- ПРИМЕНЕНИЕ НОВЫХ НОРМ С УЧЕТОМ ВОЗРАСТА ---
-    # Мы передаем в функцию categorize_by_age не только значение, но и строку возраста из этой же строки
-    for col in ["Когнитивное развитие", "Воображение_итог", "ЭмСоцИнтеллект"]:
-        df[col + "_уровень"] = df.apply(lambda row: categorize_by_age(row[col], row["Возраст"]), axis=1)
+    # Очистка числовых данных (сколько ячеек заменено нулем - в df.attrs["coerced"])
+    numeric_cols = [c for c in df.columns if c not in TEXT_COLUMNS]
+    df.attrs["coerced"] = clean_numeric(df, numeric_cols, row_masks)
+    return df
+
+# --- КОМПАКТНЫЕ ТИПЫ ---
 
+# Повторяющиеся текстовые значения храним категориями
+CATEGORY_COLUMNS = ["Возраст", "Организация"]
+# До этого модуля float32 точно хранит числа с 2 знаками после запятой
+FLOAT32_MAX_ABS = 1e4
+# До этого модуля целые числа в float64 точны: только такие переводятся в int
+INT_MAX_ABS = 2 ** 53
+
+def compact_frame(df):
+    """
+    Ужимает типы посчитанной таблицы: возраст и организация - категории,
+    целые значения - самый узкий int (П1-П5 -> int8), баллы с двумя знаками
+    после запятой - float32. Дробные значения без округления и целые больше
+    INT_MAX_ABS (случайные 1e20 в ячейке) остаются float64.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind == "i":
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif values.dtype.kind == "f" and len(values) and np.isfinite(values).all():
+            if (values == np.round(values)).all():
+                if np.abs(values).max() < INT_MAX_ABS:
+                    df[col] = pd.to_numeric(values.astype(np.int64), downcast="integer")
+            elif np.abs(values).max() < FLOAT32_MAX_ABS and (values == np.round(values, 2)).all():
+                df[col] = values.astype(np.float32)
     return df
+
+def widen_float32(values):
+    """
+    float32 -> float64 для выгрузки, с округлением до точности float32:
+    0.1 хранится как 0.10000000149, а выгружается снова как 0.1.
+    """
+    values = values.astype(np.float64)
+    finite = np.abs(values[np.isfinite(values)])
+    top = finite.max() if len(finite) else 0
+    digits = 6 - int(np.floor(np.log10(top))) if top > 0 else 6
+    return np.round(values, max(digits, 0))
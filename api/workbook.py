@@ -0,0 +1,323 @@
+import datetime
+import pickle
+import re
+import tempfile
+from api.cache import file_digest, make_key
+from api.instrument import stage
+from api.lazy import LazyModule
+from api.readers import upload_stream
+from api import store
+from api.utils import LEVELS, SCORING_VERSION, is_large_csv, iter_scored_chunks, process_dataframe, widen_float32
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+# Версия оформления Excel-отчета: входит в ключ кэша готовых файлов
+WORKBOOK_VERSION = "2"
+
+# Показатели, по которым строятся отдельные листы
+WORKBOOK_METRICS = ["Когнитивное развитие", "Воображение_итог", "ЭмСоцИнтеллект"]
+
+# Сколько строк таблицы переводится из массивов NumPy в значения Python за раз
+WRITE_CHUNK_ROWS = 10000
+
+# Строк на листе Excel (включая заголовок); остальное уходит на следующий лист
+EXCEL_MAX_ROWS = 1048576
+
+# Формат дат в ячейках, как datetime_format по умолчанию у pandas.to_excel
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+class ReportTotals:
+    """
+    Итоги для сводных листов отчета: число строк, возрасты, уровни по показателям
+    и замененные значения. Накапливаются по кускам таблицы (add), поэтому
+    для сводки не нужна вся таблица в памяти.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = []
+        self.ages = {}
+        self.levels = {metric: dict.fromkeys(LEVELS, 0) for metric in WORKBOOK_METRICS}
+        self.coerced = {}
+
+    def add(self, df):
+        self.rows += len(df)
+        self.columns = self.columns or list(df.columns)
+        for age, n in _counts_in_order(df["Возраст"]):
+            self.ages[age] = self.ages.get(age, 0) + n
+        for metric in WORKBOOK_METRICS:
+            counts = df[f"{metric}_уровень"].value_counts()
+            for level in LEVELS:
+                self.levels[metric][level] += int(counts.get(level, 0))
+        for col, n in df.attrs.get("coerced", {}).items():
+            self.coerced[col] = self.coerced.get(col, 0) + n
+
+    def age_frame(self):
+        age = pd.Series(self.ages, dtype="int64").sort_values(ascending=False, kind="stable").reset_index()
+        age.columns = ["Группа", "Кол-во"]
+        return age
+
+    def level_frame(self, metric):
+        counts = pd.Series(self.levels[metric], dtype="int64").reset_index()
+        counts.columns = ["Уровень", "Кол-во"]
+        counts["Доля"] = counts["Кол-во"] / self.rows
+        return counts
+
+    def quality_frame(self):
+        # В порядке колонок таблицы, а не в порядке, в котором куски их встретили
+        order = {col: i for i, col in enumerate(self.columns)}
+        items = sorted(self.coerced.items(), key=lambda item: order.get(item[0], len(order)))
+        return pd.DataFrame(items, columns=["Колонка", "Заменено на 0"])
+
+def _counts_in_order(series):
+    """
+    Пары (значение, количество) по убыванию количества; равные - в порядке появления.
+    У категорий value_counts ставит равные в порядке категорий, поэтому считаем коды.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = pd.Series(series.cat.codes.to_numpy())
+        counts = codes[codes >= 0].value_counts()
+        return list(zip(series.cat.categories[counts.index], counts.tolist()))
+    return list(series.value_counts().items())
+
+def build_workbook(df, output):
+    """Пишет Excel-отчет по обработанной таблице в output (путь или файловый объект)"""
+    totals = ReportTotals()
+    totals.add(df)
+    write_workbook(output, totals, [df])
+
+def write_workbook(output, totals, frames):
+    """
+    Собирает книгу: сводные листы по totals и лист Полные_данные из кусков frames.
+    Книга строится в режиме constant_memory: строки листа сбрасываются на диск
+    сразу после записи, поэтому память не растет с числом строк.
+    """
+    with stage("workbook", rows=totals.rows):
+        _write_workbook(output, totals, frames)
+
+def _write_workbook(output, totals, frames):
+    from xlsxwriter import Workbook
+
+    wb = Workbook(output, {"constant_memory": True})
+    # Как у pandas.to_excel: жирный заголовок с рамкой
+    fmt_head = wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    fmt_pct = wb.add_format({"num_format": "0.0%", "align": "center"})
+    fmt_date = wb.add_format({"num_format": DATETIME_FORMAT})
+
+    # --- ЛИСТ 1: Возрасты ---
+    age = totals.age_frame()
+    if not age.empty:
+        ws = wb.add_worksheet("Возрасты")
+        write_frame(ws, age, fmt_head)
+        ch = wb.add_chart({"type": "pie"})
+        ch.add_series({
+            "categories": ["Возрасты", 1, 0, len(age), 0],
+            "values": ["Возрасты", 1, 1, len(age), 1],
+            "data_labels": {"percentage": True}
+        })
+        ws.insert_chart("D2", ch)
+
+    # --- ЛИСТЫ ПОКАЗАТЕЛЕЙ (с % на графиках) ---
+    for metric in WORKBOOK_METRICS:
+        sheet_name = metric.replace(" ", "_")[:30]
+        counts = totals.level_frame(metric)
+
+        ws = wb.add_worksheet(sheet_name)
+        ws.set_column(0, 0, 20)
+        ws.set_column(2, 2, 10, fmt_pct)
+        write_frame(ws, counts, fmt_head)
+
+        ch = wb.add_chart({"type": "column"})
+        ch.add_series({
+            "name": metric,
+            "categories": [sheet_name, 1, 0, 3, 0],
+            "values": [sheet_name, 1, 2, 3, 2], # Колонка Доля
+            "data_labels": {"value": True, "num_format": "0.0%"}
+        })
+        ch.set_y_axis({"num_format": "0%"})
+        ws.insert_chart("E2", ch)
+
+    # --- ЛИСТ КАЧЕСТВА ДАННЫХ (только если были нераспознанные значения) ---
+    if totals.coerced:
+        quality = totals.quality_frame()
+        ws = wb.add_worksheet("Качество_данных")
+        ws.set_column(0, 0, 30)
+        write_frame(ws, quality, fmt_head)
+
+    # --- ЛИСТ ИТОГ ---
+    write_frames(wb, "Полные_данные", frames, fmt_head, date_format=fmt_date)
+
+    wb.close()
+
+def write_frames(wb, sheet_name, frames, header_format=None, max_rows=EXCEL_MAX_ROWS, date_format=None):
+    """
+    Пишет куски таблицы подряд на один лист. Строки сверх лимита Excel
+    продолжаются на листах sheet_name_2, sheet_name_3, ...
+    """
+    ws, row, part = None, 0, 1
+    for df in frames:
+        if ws is None:
+            ws = wb.add_worksheet(sheet_name)
+            row = write_header(ws, df.columns, header_format)
+        start = 0
+        while start < len(df):
+            if row >= max_rows:
+                part += 1
+                ws = wb.add_worksheet(f"{sheet_name}_{part}")
+                row = write_header(ws, df.columns, header_format)
+            take = min(len(df) - start, max_rows - row)
+            write_rows(ws, df.iloc[start:start + take], row, date_format=date_format)
+            start += take
+            row += take
+
+def write_header(ws, columns, header_format=None):
+    """Строка заголовков; возвращает номер первой строки данных"""
+    for c, name in enumerate(columns):
+        ws.write_string(0, c, str(name), header_format)
+    return 1
+
+def write_frame(ws, df, header_format=None):
+    """Пишет небольшую таблицу на лист: заголовок и строки (пропуски - пустые ячейки)"""
+    write_rows(ws, df, write_header(ws, df.columns, header_format))
+
+def write_rows(ws, df, first_row, chunk_rows=WRITE_CHUNK_ROWS, date_format=None):
+    """
+    Пишет строки таблицы начиная с first_row строго по порядку (требование
+    constant_memory); значения берутся из массивов NumPy кусками по chunk_rows.
+    Пропуски (NaN, NaT) остаются пустыми ячейками, как в pandas.to_excel;
+    даты пишутся датами Excel в формате date_format.
+    """
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        columns = [_column_cells(ws, chunk.iloc[:, c], date_format) for c in range(chunk.shape[1])]
+        for i in range(len(chunk)):
+            row = first_row + start + i
+            for c, (cells, write) in enumerate(columns):
+                value = cells[i]
+                if value is not None:
+                    write(row, c, value)
+
+def _column_cells(ws, series, date_format=None):
+    """Значения куска колонки (NaN, NaT -> None) и функция записи ячейки по типу колонки"""
+    values = series.to_numpy()
+    kind = values.dtype.kind
+    if kind == "M":
+        # tolist() в наносекундах дал бы целые числа; в микросекундах - datetime (NaT -> None)
+        cells = values.astype("datetime64[us]").tolist()
+        return cells, lambda row, col, value: ws.write_datetime(row, col, value, date_format)
+    if kind in "iu":
+        return values.tolist(), ws.write_number
+    if kind == "b":
+        return values.tolist(), ws.write_boolean
+    if kind == "f":
+        if values.dtype.itemsize < 8:
+            values = widen_float32(values)
+        cells = values.tolist()
+        if not np.isfinite(values).all():
+            # inf пишется текстом, как inf_rep в pandas
+            for i in np.flatnonzero(~np.isfinite(values)):
+                v = cells[i]
+                cells[i] = None if v != v else ("inf" if v > 0 else "-inf")
+            return cells, ws.write
+        return cells, ws.write_number
+    cells = values.tolist()
+    for i in np.flatnonzero(pd.isna(values)):
+        cells[i] = None
+    return cells, _object_writer(ws, date_format)
+
+def _object_writer(ws, date_format=None):
+    """Запись ячеек текстовой колонки: строки - как текст (не формулы и не ссылки)"""
+    def write(row, col, value):
+        if isinstance(value, str):
+            ws.write_string(row, col, value)
+        elif isinstance(value, datetime.datetime) and value.tzinfo is None:
+            ws.write_datetime(row, col, value, date_format)
+        elif isinstance(value, (bool, np.bool_)):
+            ws.write_boolean(row, col, bool(value))
+        elif isinstance(value, (int, float, np.number)):
+            ws.write_number(row, col, value)
+        else:
+            ws.write_string(row, col, str(value))
+    return write
+
+# --- ОТЧЕТ ПО ОДНОМУ ФАЙЛУ (без привязки к Flask: вызывается и из фоновых задач) ---
+
+def report_filename(upload_name):
+    """Имя отчета: номер группы из имени файла (12-34...) + _results.xlsx"""
+    match = re.match(r'(\d+)-(\d+)', upload_name or "")
+    name_part = f"{match.group(1)}-{match.group(2)}" if match else "Results"
+    return f"{name_part}_results.xlsx"
+
+def report_key(file_storage):
+    """Ключ кэша готового отчета (он же ETag)"""
+    return make_key("process", WORKBOOK_VERSION, SCORING_VERSION, file_digest(file_storage))
+
+def build_report(file_storage, output, progress=None, wave=None):
+    """
+    Считает метрики по файлу и пишет Excel-отчет в output (большие CSV - кусками).
+    Если включено хранилище (api/store.py), таблица сохраняется в волну wave
+    (None - определить по датам); возвращает волну или None.
+    """
+    if is_large_csv(file_storage):
+        return build_chunked_report(file_storage, output, progress, wave)
+    if progress: progress(0.1, "Расчет показателей")
+    df = process_dataframe(file_storage)
+    stored = store.save_upload(file_storage, df, wave) if store.enabled() else None
+    if progress: progress(0.5, "Формирование Excel")
+    build_workbook(df, output)
+    return stored
+
+def build_chunked_report(file_storage, output, progress=None, wave=None):
+    """
+    Отчет по CSV, который не читается в память целиком: посчитанные куски
+    складываются во временный файл, итоги для сводных листов копятся по ходу,
+    затем книга собирается, читая куски с диска по одному.
+    """
+    stored = None
+    stream = upload_stream(file_storage)
+    size = stream.seek(0, 2) or 1
+    totals = ReportTotals()
+    with tempfile.TemporaryFile() as staging:
+        for chunk in iter_scored_chunks(file_storage):
+            totals.add(chunk)
+            pickle.dump(chunk, staging, protocol=pickle.HIGHEST_PROTOCOL)
+            if progress: progress(0.05 + 0.45 * min(stream.tell() / size, 1), f"Посчитано строк: {totals.rows}")
+        if store.enabled():
+            staging.seek(0)
+            stored = store.save_upload(file_storage, _staged_chunks(staging), wave)
+        if progress: progress(0.5, "Формирование Excel")
+        staging.seek(0)
+        write_workbook(output, totals, _staged_chunks(staging))
+    return stored
+
+def build_incremental_report(file_storage, output, progress=None, wave=None, source=None):
+    """
+    Отчет по растущей выгрузке: считаются только новые и измененные строки
+    (store.sync_export), сводные листы - по итогам из базы, Полные_данные -
+    все сохраненные строки выгрузки. Возвращает статистику слияния.
+    """
+    if progress: progress(0.1, "Расчет новых строк")
+    stats = store.sync_export(file_storage, wave, source)
+    if progress: progress(0.5, "Формирование Excel")
+    totals = stored_totals(stats["wave"], stats["source"], stats["columns"])
+    write_workbook(output, totals, store.iter_frames(stats["wave"], stats["source"], stats["columns"]))
+    return stats
+
+def stored_totals(wave, source=None, columns=None):
+    """ReportTotals по сохраненным строкам - запросами к базе, без чтения таблицы"""
+    agg = store.aggregates(wave, source)
+    totals = ReportTotals()
+    totals.rows = agg["rows"]
+    totals.columns = list(columns or store.STORE_COLUMNS)
+    totals.ages = agg["ages"]
+    totals.levels = {metric: agg["levels"][metric] for metric in WORKBOOK_METRICS}
+    totals.coerced = agg["coerced"]
+    return totals
+
+def _staged_chunks(staging):
+    while True:
+        try:
+            yield pickle.load(staging)
+        except EOFError:
+            return
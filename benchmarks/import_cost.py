@@ -0,0 +1,80 @@
+"""
+Стоимость холодного старта функций: сколько стоит импорт каждого модуля.
+
+Каждая цель импортируется в отдельном чистом процессе с `python -X importtime`,
+время (self) суммируется по пакетам верхнего уровня.
+
+    python benchmarks/import_cost.py                       # api.index и api.compare
+    python benchmarks/import_cost.py api.compare --top 15
+    python benchmarks/import_cost.py --deferred            # плюс тяжелые модули, которые грузятся лениво
+    python benchmarks/import_cost.py --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["api.index", "api.compare"]
+
+# Модули, которые функции импортируют только при первом использовании
+DEFERRED = ["pandas", "numpy", "openpyxl", "xlsxwriter", "docx", "matplotlib.figure", "matplotlib.backends.backend_agg"]
+
+def measure(target, repeat=3):
+    """Лучшее из repeat: (суммарное время импорта цели в мс, {пакет: мс})"""
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+        per_package = defaultdict(float)
+        total = 0.0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+            per_package[name.split(".")[0]] += int(self_us) / 1000
+            if name == target:
+                total = int(cumulative_us) / 1000
+        if best is None or total < best[0]:
+            best = (total, dict(per_package))
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--top", type=int, default=10, help="сколько самых дорогих пакетов показать")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--deferred", action="store_true", help="замерить и лениво загружаемые модули")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {"targets": {}, "deferred": {}}
+    for target in args.targets:
+        total, per_package = measure(target, args.repeat)
+        top = sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[:args.top]
+        report["targets"][target] = {"total_ms": round(total, 1), "packages_ms": {k: round(v, 1) for k, v in top}}
+    if args.deferred:
+        for module in DEFERRED:
+            report["deferred"][module] = round(measure(module, args.repeat)[0], 1)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for target, data in report["targets"].items():
+        print(f"{target}: {data['total_ms']:.1f} ms")
+        for package, ms in data["packages_ms"].items():
+            print(f"    {package:<28} {ms:8.1f} ms")
+    if report["deferred"]:
+        print("deferred (first use):")
+        for module, ms in report["deferred"].items():
+            print(f"    {module:<28} {ms:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
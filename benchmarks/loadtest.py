@@ -0,0 +1,346 @@
+"""
+Нагрузочный тест: приложения api/index.py и api/compare.py под gunicorn
+(несколько воркеров-процессов), --users одновременных пользователей шлют
+смешанные загрузки синтетических выгрузок (benchmarks/synthetic.py).
+
+Отчет:
+  - пропускная способность и доля ошибок;
+  - задержка p50/p95/p99 по сценариям и время на сервере (total из Server-Timing):
+    разница - ожидание свободного воркера, по ней подбирается их число;
+  - RSS каждого воркера (/proc/<pid>/status) после прогрева, максимум и в конце:
+    рост от запроса к запросу выдает утечки (незакрытые фигуры, копящиеся кэши).
+
+Кэши таблиц и готовых отчетов по умолчанию отключены (--cache включает):
+одинаковые синтетические файлы иначе считались бы один раз.
+Нужен gunicorn (в зависимости Vercel не входит): pip install gunicorn. Только Linux (/proc).
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --users 30 --requests 300 --workers 4 --rows 1000 5000
+    python benchmarks/loadtest.py --mix process=1,compare=1,batch=0 --max-growth-mb 50 --json
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.instrument import percentile
+from synthetic import cached_export
+
+COMPARE_MODES = ("cross", "paired", "both")
+CHART_FORMATS = ("png", "native")
+PERCENTILES = (50, 95, 99)
+READY_TIMEOUT = 60
+RSS_INTERVAL = 0.5
+
+# --- СЕРВЕРЫ ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(app, workers, env):
+    """gunicorn с workers синхронными воркерами; возвращает (процесс, порт)"""
+    port = free_port()
+    cmd = [sys.executable, "-m", "gunicorn", app, "--chdir", ROOT, "--bind", f"127.0.0.1:{port}",
+           "--workers", str(workers), "--timeout", "600", "--graceful-timeout", "5", "--log-level", "warning"]
+    return subprocess.Popen(cmd, env=env), port
+
+def wait_ready(port, path, proc):
+    """Ждет, пока сервер ответит на GET path"""
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn завершился с кодом {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервер на порту {port} не запустился за {READY_TIMEOUT} с")
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+# --- ПАМЯТЬ ВОРКЕРОВ (/proc) ---
+
+def child_pids(parent):
+    """Прямые потомки процесса (воркеры gunicorn у мастера)"""
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # pid (comm) state ppid ...: comm может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(name))
+    return pids
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+class RssSampler:
+    """Фоновый опрос RSS воркеров: {(приложение, pid): [после прогрева, максимум, последнее]}"""
+
+    def __init__(self, servers):
+        self.servers = servers
+        self.workers = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        for app, proc in self.servers.items():
+            for pid in child_pids(proc.pid):
+                rss = rss_mb(pid)
+                if rss is None:
+                    continue
+                # Воркер, перезапущенный во время теста, появляется с новым pid
+                entry = self.workers.setdefault((app, pid), [rss, rss, rss])
+                entry[1] = max(entry[1], rss)
+                entry[2] = rss
+
+    def _run(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+# --- ЗАПРОСЫ ---
+
+def multipart(fields, files):
+    """Тело multipart/form-data: fields - {имя: значение}, files - [(поле, имя файла, байты)]"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for field, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+class Uploads:
+    """Байты синтетических выгрузок (файл читается с диска один раз)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, rows, fmt, wave="start"):
+        key = (rows, fmt, wave)
+        with self._lock:
+            if key not in self._data:
+                path = cached_export(rows, fmt, wave)
+                with open(path, "rb") as f:
+                    self._data[key] = (f"12-34 {wave}-{rows}.{fmt}", f.read())
+        return self._data[key]
+
+def make_plan(n, mix, rows, formats, seed):
+    """Последовательность запросов: (сценарий, приложение, путь, поля формы, файлы)"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    plan = []
+    for _ in range(n):
+        kind, size, fmt = rng.choice(kinds), rng.choice(rows), rng.choice(formats)
+        if kind == "process":
+            plan.append((f"process[{fmt}]", "index", "/api/process", {}, [("file", size, fmt, "start")]))
+        elif kind == "batch":
+            plan.append(("batch", "index", "/api/batch", {}, [("files", size, fmt, "start"), ("files", size, fmt, "end")]))
+        else:
+            mode, charts = rng.choice(COMPARE_MODES), rng.choice(CHART_FORMATS)
+            plan.append((f"compare[{mode},{charts}]", "compare", "/api/compare", {"mode": mode, "chart_format": charts},
+                         [("file_start", size, fmt, "start"), ("file_end", size, fmt, "end")]))
+    return plan
+
+def server_total(header):
+    """total;dur=... из Server-Timing в секундах (None, если заголовка нет)"""
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name == "total" and params.startswith("dur="):
+            return float(params[4:].split(";")[0]) / 1000
+    return None
+
+def send(ports, uploads, item):
+    """Один запрос; результат - (сценарий, статус, секунды, секунды на сервере)"""
+    scenario, app, path, fields, files = item
+    body, content_type = multipart(fields, [(field, *uploads.get(size, fmt, wave)) for field, size, fmt, wave in files])
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", ports[app], timeout=600)
+        conn.request("POST", path, body=body, headers={"Content-Type": content_type})
+        res = conn.getresponse()
+        res.read()
+        conn.close()
+        status, server = res.status, server_total(res.getheader("Server-Timing"))
+    except OSError:
+        status, server = 0, None
+    return scenario, status, time.perf_counter() - start, server
+
+def run_plan(plan, users, ports, uploads):
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        return list(pool.map(lambda item: send(ports, uploads, item), plan))
+
+# --- ОТЧЕТ ---
+
+def summarize(results, elapsed, sampler):
+    scenarios = {}
+    for scenario, status, seconds, server in results:
+        for key in (scenario, "all"):
+            s = scenarios.setdefault(key, {"latency": [], "server": [], "errors": 0})
+            s["latency"].append(seconds)
+            if server is not None:
+                s["server"].append(server)
+            if status != 200:
+                s["errors"] += 1
+    table = {}
+    for key, s in sorted(scenarios.items(), key=lambda kv: (kv[0] == "all", kv[0])):
+        latency = sorted(s["latency"])
+        entry = {"requests": len(latency), "errors": s["errors"]}
+        for p in PERCENTILES:
+            entry[f"p{p}"] = round(percentile(latency, p), 3)
+        entry["max"] = round(latency[-1], 3)
+        entry["server_p50"] = round(percentile(sorted(s["server"]), 50), 3) if s["server"] else None
+        table[key] = entry
+    workers = [{"app": app, "pid": pid, "rss_start_mb": round(start, 1), "rss_max_mb": round(peak, 1),
+                "rss_end_mb": round(end, 1), "growth_mb": round(end - start, 1)}
+               for (app, pid), (start, peak, end) in sorted(sampler.workers.items())]
+    total = table["all"]
+    return {
+        "requests": total["requests"],
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(total["requests"] / elapsed, 2),
+        "error_rate": round(total["errors"] / total["requests"], 4),
+        "scenarios": table,
+        "workers": workers,
+    }
+
+def print_report(report):
+    print(f"{report['requests']} запросов за {report['seconds']} с: {report['throughput_rps']} запр/с, "
+          f"ошибок {report['error_rate'] * 100:.1f}%\n")
+    width = max(len(k) for k in report["scenarios"])
+    print(f"{'scenario':<{width}} {'n':>5} {'err':>4} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'srv p50':>8}")
+    for key, s in report["scenarios"].items():
+        srv = f"{s['server_p50']:8.3f}" if s["server_p50"] is not None else f"{'-':>8}"
+        print(f"{key:<{width}} {s['requests']:5d} {s['errors']:4d} {s['p50']:7.3f} {s['p95']:7.3f} "
+              f"{s['p99']:7.3f} {s['max']:7.3f} {srv}")
+    print(f"\n{'app':<8} {'pid':>7} {'RSS after warmup':>17} {'max':>8} {'end':>8} {'growth':>8}  (MB)")
+    for w in report["workers"]:
+        print(f"{w['app']:<8} {w['pid']:>7} {w['rss_start_mb']:17.1f} {w['rss_max_mb']:8.1f} "
+              f"{w['rss_end_mb']:8.1f} {w['growth_mb']:8.1f}")
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("process", "compare", "batch"):
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий: {kind}")
+        mix[kind] = int(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("все веса нулевые")
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--requests", type=int, default=200, help="запросов в замеряемой части")
+    parser.add_argument("--warmup", type=int, default=None, help="запросов на прогрев (по умолчанию 2 на воркер)")
+    parser.add_argument("--workers", type=int, default=4, help="воркеров gunicorn у каждого приложения")
+    parser.add_argument("--pool-workers", type=int, default=1, help="KIDSKI_WORKERS внутри воркера")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("process=3,compare=2,batch=1"))
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="не отключать кэши таблиц и отчетов")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="больше - код выхода 1")
+    parser.add_argument("--max-growth-mb", type=float, default=None, help="рост RSS воркера больше - код выхода 1")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        sys.exit("Нужен gunicorn: pip install gunicorn")
+
+    env = dict(os.environ, KIDSKI_WORKERS=str(args.pool_workers))
+    if not args.cache:
+        env.update(KIDSKI_FRAME_CACHE_ITEMS="0", KIDSKI_ARTIFACT_CACHE_MB="0")
+
+    # Файлы генерируются до старта серверов, чтобы не мешать замеру
+    uploads = Uploads()
+    for size in args.rows:
+        for fmt in args.formats:
+            for wave in ("start", "end"):
+                uploads.get(size, fmt, wave)
+
+    servers, ports = {}, {}
+    try:
+        for app, module, path in (("index", "api.index:app", "/api/metrics"),
+                                  ("compare", "api.compare:app", "/api/compare/metrics")):
+            servers[app], ports[app] = start_server(module, args.workers, env)
+            wait_ready(ports[app], path, servers[app])
+
+        # Прогрев: импорты pandas/matplotlib/docx в каждом воркере не должны попасть в замер
+        warmup = args.warmup if args.warmup is not None else 2 * args.workers * len(servers)
+        run_plan(make_plan(warmup, args.mix, args.rows, args.formats, args.seed + 1), args.users, ports, uploads)
+
+        sampler = RssSampler(servers)
+        sampler.start()
+        start = time.perf_counter()
+        results = run_plan(make_plan(args.requests, args.mix, args.rows, args.formats, args.seed),
+                           args.users, ports, uploads)
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+    finally:
+        for proc in servers.values():
+            stop_server(proc)
+
+    report = summarize(results, elapsed, sampler)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    failed = report["error_rate"] > args.max_error_rate
+    if args.max_growth_mb is not None:
+        failed = failed or any(w["growth_mb"] > args.max_growth_mb for w in report["workers"])
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Бенчмарки на синтетических выгрузках (benchmarks/synthetic.py) с базовой линией в JSON.
+
+Замеры (лучшее из --repeat, секунды):
+  process[fmt,rows].parse|clean|score|compact - этапы process_dataframe
+  process[fmt,rows].total                      - process_dataframe целиком
+  workbook[fmt,rows]                           - POST /api/process (Excel-отчет)
+  compare[mode,charts][fmt,rows]               - POST /api/compare: cross/paired/both, png/native
+
+Кэши таблиц и готовых отчетов отключены: меряется расчет, а не попадание в кэш.
+Перед замерами один прогон с включенным кэшем таблиц проверяет, что разные
+выгрузки не получают одну запись кэша (иначе код выхода 1).
+Без --save результаты сравниваются с базовой линией: замер медленнее базового
+больше чем на --tolerance (и больше чем на --min-delta секунд) - регрессия, код выхода 1.
+
+    python benchmarks/suite.py --save                          # записать базовую линию
+    python benchmarks/suite.py                                 # проверить на регрессии
+    python benchmarks/suite.py --only process --rows 1000 1000000 --formats csv
+    python benchmarks/suite.py --json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# До импорта api: кэши читают настройки при импорте
+os.environ.setdefault("KIDSKI_FRAME_CACHE_ITEMS", "0")
+os.environ.setdefault("KIDSKI_ARTIFACT_CACHE_MB", "0")
+
+import pandas as pd
+
+from api.cache import FRAME_CACHE
+from api.utils import COLUMN_MAPPING, SCORING, compact_frame, prepare_frame, process_dataframe, read_upload
+from synthetic import cached_export
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+GROUPS = ("process", "workbook", "compare")
+COMPARE_MODES = ("cross", "paired", "both")
+CHART_FORMATS = ("png", "native")
+
+def best_of(fn, repeat):
+    """Лучшее время из repeat запусков fn"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def open_upload(path):
+    """Файл на диске с именем загрузки - как входной файл фоновой задачи"""
+    f = open(path, "rb")
+    f.filename = os.path.basename(path)
+    return f
+
+# --- process_dataframe ПО ЭТАПАМ ---
+
+def process_stages(path):
+    """
+    Один проход process_dataframe, разложенный на этапы: {этап: секунды}.
+    Вызываются те же функции, что и в process_dataframe/score_frame.
+    """
+    times = {}
+    start = time.perf_counter()
+    with open_upload(path) as f:
+        df = read_upload(f, COLUMN_MAPPING.keys())
+    times["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = prepare_frame(df)
+    times["clean"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    SCORING.compute(df)
+    times["score"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compact_frame(df)
+    times["compact"] = time.perf_counter() - start
+    return times
+
+def bench_process(fmt, rows, repeat):
+    path = cached_export(rows, fmt)
+    results = {}
+    for _ in range(repeat):
+        for stage, elapsed in process_stages(path).items():
+            key = f"process[{fmt},{rows}].{stage}"
+            results[key] = min(results.get(key, elapsed), elapsed)
+
+    def total():
+        with open_upload(path) as f:
+            process_dataframe(f)
+
+    results[f"process[{fmt},{rows}].total"] = best_of(total, repeat)
+    return results
+
+# --- ПРОВЕРКА КЭША ТАБЛИЦ ---
+
+def check_frame_cache(fmt, rows):
+    """
+    process_dataframe с включенным кэшем таблиц: каждая из двух разных выгрузок
+    (начало и конец года) дважды дает ту же таблицу, что и без кэша, и таблицы
+    выгрузок различаются. Возвращает текст ошибки или None.
+    """
+    paths = [cached_export(rows, fmt, "start"), cached_export(rows, fmt, "end")]
+
+    def process(path):
+        with open_upload(path) as f:
+            return process_dataframe(f)
+
+    max_items = FRAME_CACHE.max_items
+    try:
+        FRAME_CACHE.max_items = 0
+        expected = [process(path) for path in paths]
+        FRAME_CACHE.max_items = 8
+        FRAME_CACHE.clear()
+        got = [process(path) for path in paths + paths]
+    finally:
+        FRAME_CACHE.max_items = max_items
+        FRAME_CACHE.clear()
+    if expected[0].equals(expected[1]):
+        return f"выгрузки {fmt} начала и конца года дали одинаковые таблицы"
+    for i, df in enumerate(got):
+        if not df.equals(expected[i % 2]):
+            return f"кэш таблиц вернул чужую таблицу для {os.path.basename(paths[i % 2])}"
+    return None
+
+# --- ЭНДПОИНТЫ ---
+
+def post(client, url, files, form=None):
+    data = dict(form or {})
+    for field, path in files.items():
+        with open(path, "rb") as f:
+            data[field] = (io.BytesIO(f.read()), os.path.basename(path))
+    res = client.post(url, data=data, content_type="multipart/form-data")
+    if res.status_code != 200:
+        raise RuntimeError(f"{url}: {res.status_code} {res.get_data(as_text=True)[:300]}")
+    return res
+
+def bench_workbook(fmt, rows, repeat):
+    from api.index import app
+    client = app.test_client()
+    path = cached_export(rows, fmt)
+    return {f"workbook[{fmt},{rows}]": best_of(lambda: post(client, "/api/process", {"file": path}), repeat)}
+
+def bench_compare(fmt, rows, repeat):
+    from api.compare import app
+    client = app.test_client()
+    files = {"file_start": cached_export(rows, fmt, "start"), "file_end": cached_export(rows, fmt, "end")}
+    results = {}
+    for mode in COMPARE_MODES:
+        for charts in CHART_FORMATS:
+            form = {"mode": mode, "chart_format": charts}
+            results[f"compare[{mode},{charts}][{fmt},{rows}]"] = best_of(
+                lambda: post(client, "/api/compare", files, form), repeat)
+    return results
+
+BENCHES = {"process": bench_process, "workbook": bench_workbook, "compare": bench_compare}
+
+# --- БАЗОВАЯ ЛИНИЯ ---
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+def save_baseline(path, results):
+    """Дописывает результаты в базовую линию (замеры, которых нет в этом запуске, сохраняются)"""
+    merged = load_baseline(path)
+    merged.update({name: round(value, 4) for name, value in results.items()})
+    meta = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "saved": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": dict(sorted(merged.items()))}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def compare_with_baseline(results, baseline, tolerance, min_delta):
+    """Строки отчета (имя, базовое, текущее, отношение, статус) и есть ли регрессии"""
+    rows, failed = [], False
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, value, None, "new"))
+            continue
+        ratio = value / base if base else float("inf")
+        regressed = value > base * (1 + tolerance) and value - base > min_delta
+        failed = failed or regressed
+        rows.append((name, base, value, ratio, "REGRESSION" if regressed else "ok"))
+    return rows, failed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="строк для process и workbook")
+    parser.add_argument("--compare-rows", type=int, nargs="+", default=[1000], help="строк в каждом файле сравнения")
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.02, help="замедление меньше стольких секунд - не регрессия")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # Прогрев: импорты и первые вызовы (шрифты matplotlib, шаблон docx) не должны попасть в замер
+    for group in args.only:
+        BENCHES[group](args.formats[0], 100, 1)
+
+    for fmt in args.formats:
+        error = check_frame_cache(fmt, 1000)
+        if error:
+            print(f"Кэш таблиц: {error}", file=sys.stderr)
+            sys.exit(1)
+
+    results = {}
+    for group in args.only:
+        for fmt in args.formats:
+            for rows in args.compare_rows if group == "compare" else args.rows:
+                results.update(BENCHES[group](fmt, rows, args.repeat))
+
+    if args.save:
+        save_baseline(args.baseline, results)
+    rows, failed = compare_with_baseline(results, {} if args.save else load_baseline(args.baseline),
+                                         args.tolerance, args.min_delta)
+
+    if args.json:
+        print(json.dumps({name: {"baseline": base, "seconds": round(value, 4), "status": status}
+                          for name, base, value, _, status in rows}, ensure_ascii=False, indent=2))
+    else:
+        width = max(len(r[0]) for r in rows)
+        print(f"{'case':<{width}} {'baseline':>9} {'now':>9} {'ratio':>6}  status")
+        for name, base, value, ratio, status in rows:
+            base_s = f"{base:9.4f}" if base is not None else f"{'-':>9}"
+            ratio_s = f"{ratio:6.2f}" if ratio is not None else f"{'-':>6}"
+            print(f"{name:<{width}} {base_s} {value:9.4f} {ratio_s}  {status}")
+        if args.save:
+            print(f"\nБазовая линия сохранена: {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
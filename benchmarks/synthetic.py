@@ -0,0 +1,157 @@
+"""
+Синтетические выгрузки анкеты: те же длинные заголовки, что в COLUMN_MAPPING,
+правдоподобные значения и тот же «мусор», что в настоящих файлах (пустые ячейки,
+десятичная запятая, пробелы вокруг чисел, текст вместо числа, лишние колонки).
+
+Две волны одной группы: start (сентябрь) и end (май) - большая часть кодов детей
+общая, часть детей есть только в одной волне, некоторые коды повторяются.
+
+    python benchmarks/synthetic.py --rows 1000 100000 --formats csv xlsx --out /tmp/exports
+    python benchmarks/synthetic.py --rows 1000000 --formats csv --wave end
+
+Из кода: cached_export(rows, fmt, wave) - путь к файлу (создается один раз в CACHE_DIR).
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from api.utils import COLUMN_MAPPING
+
+CACHE_DIR = os.environ.get("KIDSKI_BENCH_DATA") or os.path.join(tempfile.gettempdir(), "kidski-bench-data")
+CHUNK_ROWS = 100000
+
+# Диапазоны ответов по колонкам (имена после COLUMN_MAPPING): (от, до, дробные)
+VALUE_RANGES = {
+    "И1-1Сум": (0, 18, False), "И1-2Связн": (0, 5, False), "И1-2РечОформ": (0, 5, False),
+    "И1-2СамРасс": (0, 5, False), "И2Сум": (0, 16, False), "И4Сум": (0, 11, False),
+    "В1": (0, 3, False), "В2": (0, 3, False), "ЭмоцИдент": (0, 8, False),
+    "Планир": (0, 4, True), "Сотруд": (0, 4, True), "Рефлек": (0, 4, True),
+}
+for _i in range(1, 6):
+    VALUE_RANGES[f"И3-{_i}Кольца"] = (0, 40, False)
+    VALUE_RANGES[f"И3-{_i}Ошиб"] = (0, 10, False)
+    VALUE_RANGES[f"И5-{_i}Время"] = (5, 150, False)
+    VALUE_RANGES[f"И5-{_i}Ошиб"] = (0, 7, False)
+
+AGES = ["2-3 года", "3-4 года", "4-5 лет", "5-6 лет", "6-7 лет (подготовительная)", "старшая", "7-8", None]
+AGE_WEIGHTS = [0.08, 0.17, 0.2, 0.2, 0.17, 0.05, 0.03, 0.1]
+REACHED = ["да", "нет", "Нет ", None]
+REACHED_WEIGHTS = [0.6, 0.12, 0.05, 0.23]
+ORGANIZATIONS = [f"ДОУ №{k}" for k in range(1, 21)] + ["Детсад «Радуга»", "Центр развития «Умка»"]
+
+# Лишние колонки настоящей выгрузки, которые обработка не читает
+EXTRA_COLUMNS = ["Согласие родителей на обработку данных", "Комментарий педагога", "Адрес электронной почты"]
+
+# Доли «мусорных» ячеек в числовых колонках
+BLANK, COMMA, PADDED, JUNK = 0.05, 0.03, 0.02, 0.005
+
+# Волны: сдвиг номеров детей (доля общих кодов ~85%) и месяц заполнения
+WAVES = {"start": (0.0, "2024-09-01"), "end": (0.15, "2025-05-05")}
+DUPLICATE_SHARE = 0.03
+
+def noisy_numbers(rng, n, low, high, fractional):
+    """Колонка ответов (object): числа и немного мусора, как в выгрузках форм"""
+    if fractional:
+        values = np.round(rng.uniform(low, high, n), 1)
+    else:
+        values = rng.integers(low, high + 1, n)
+    cells = values.astype(object)
+    u = rng.random(n)
+    cells[u < BLANK] = None
+    comma = (u >= BLANK) & (u < BLANK + COMMA)
+    cells[comma] = [f"{v:.1f}".replace(".", ",") for v in values[comma]]
+    padded = (u >= BLANK + COMMA) & (u < BLANK + COMMA + PADDED)
+    cells[padded] = (" " + pd.Series(values[padded]).astype(str) + " ").to_numpy()
+    cells[(u >= BLANK + COMMA + PADDED) & (u < BLANK + COMMA + PADDED + JUNK)] = "абв"
+    return cells
+
+def make_frame(rows, seed=0, wave="start", first_row=0, file_rows=None):
+    """
+    Кусок выгрузки: rows строк начиная с first_row из файла в file_rows строк
+    (номера детей и ID сквозные, поэтому куски складываются в один файл).
+    """
+    rng = np.random.default_rng([seed, first_row, list(WAVES).index(wave)])
+    shift, month = WAVES[wave]
+    file_rows = file_rows or first_row + rows
+    index = np.arange(first_row, first_row + rows)
+
+    child = index + int(shift * file_rows)
+    # Повторные анкеты: код уже встречавшегося в куске ребенка
+    repeat = rng.random(rows) < DUPLICATE_SHARE
+    if repeat.any() and not repeat.all():
+        child[repeat] = rng.choice(child[~repeat], repeat.sum())
+    minutes = rng.integers(0, 30 * 24 * 60, rows)
+
+    data = {}
+    for raw, name in COLUMN_MAPPING.items():
+        if name == "ID":
+            data[raw] = index + 1
+        elif name == "Время":
+            data[raw] = (pd.Timestamp(month) + pd.to_timedelta(minutes, unit="m")).strftime("%Y-%m-%d %H:%M:%S")
+        elif name == "Организация":
+            data[raw] = rng.choice(ORGANIZATIONS, rows)
+        elif name == "Код":
+            data[raw] = np.char.add("K", child.astype(str))
+        elif name == "Возраст":
+            data[raw] = rng.choice(np.array(AGES, dtype=object), rows, p=AGE_WEIGHTS)
+        elif name.endswith("Дошел"):
+            data[raw] = rng.choice(np.array(REACHED, dtype=object), rows, p=REACHED_WEIGHTS)
+        else:
+            data[raw] = noisy_numbers(rng, rows, *VALUE_RANGES[name])
+    for name in EXTRA_COLUMNS:
+        data[name] = rng.choice(np.array(["да", "", "см. примечание"], dtype=object), rows)
+    return pd.DataFrame(data, index=pd.RangeIndex(first_row, first_row + rows))
+
+def iter_frames(rows, seed=0, wave="start", chunk_rows=CHUNK_ROWS):
+    """Выгрузка кусками по chunk_rows строк (большие файлы не собираются в памяти)"""
+    for start in range(0, rows, chunk_rows):
+        yield make_frame(min(chunk_rows, rows - start), seed, wave, first_row=start, file_rows=rows)
+
+def write_export(path, rows, fmt, seed=0, wave="start"):
+    """Пишет выгрузку в path: csv (разделитель ;, UTF-8 с BOM, как у Excel) или xlsx"""
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            for i, df in enumerate(iter_frames(rows, seed, wave)):
+                df.to_csv(f, sep=";", index=False, header=i == 0)
+        return path
+    from xlsxwriter import Workbook
+    from api.workbook import write_frames
+    wb = Workbook(path, {"constant_memory": True})
+    write_frames(wb, "Ответы", iter_frames(rows, seed, wave))
+    wb.close()
+    return path
+
+def cached_export(rows, fmt, wave="start", seed=0, cache_dir=CACHE_DIR):
+    """Путь к выгрузке с такими параметрами; файл создается при первом обращении"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{wave}-{rows}-s{seed}.{fmt}")
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        write_export(tmp, rows, fmt, seed, wave)
+        os.replace(tmp, path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument("--wave", nargs="+", default=["start", "end"], choices=list(WAVES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    for wave in args.wave:
+        for fmt in args.formats:
+            for rows in args.rows:
+                path = cached_export(rows, fmt, wave, args.seed, args.out)
+                print(f"{path}  {os.path.getsize(path) / 2**20:.1f} MB")
+
+if __name__ == "__main__":
+    main()
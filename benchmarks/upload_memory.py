@@ -0,0 +1,109 @@
+"""
+Память на чтение загруженного файла: пик выделений (tracemalloc) на мегабайт загрузки.
+
+Загрузка моделируется так же, как ее хранит werkzeug: SpooledTemporaryFile
+(до 500 КБ в памяти, дальше на диске) внутри FileStorage. Сравниваются:
+  copy   - как было: file_storage.read() -> io.BytesIO -> парсер
+  stream - парсер читает прямо из загруженного потока (readers.upload_stream)
+
+    python benchmarks/upload_memory.py
+    python benchmarks/upload_memory.py --rows 2000 20000 --formats csv
+    python benchmarks/upload_memory.py --json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+from werkzeug.datastructures import FileStorage
+
+from api.readers import read_table, upload_stream
+from api.utils import COLUMN_MAPPING, TEXT_COLUMNS
+
+# Как werkzeug.formparser.default_stream_factory
+SPOOL_MAX_SIZE = 500 * 1024
+
+def make_frame(rows, seed=0):
+    """Таблица в формате выгрузки: все колонки COLUMN_MAPPING, числа и немного мусора"""
+    rng = random.Random(seed)
+    data = {}
+    for raw, name in COLUMN_MAPPING.items():
+        if name in TEXT_COLUMNS:
+            data[raw] = [f"{name}-{rng.randint(1, 500)}" for _ in range(rows)]
+        else:
+            data[raw] = [rng.choice([rng.randint(0, 60), round(rng.random() * 10, 1), "", "нет"]) for _ in range(rows)]
+    return pd.DataFrame(data)
+
+def encode(df, fmt):
+    buf = io.BytesIO()
+    if fmt == "csv":
+        df.to_csv(buf, sep=";", index=False)
+    else:
+        df.to_excel(buf, index=False)
+    return buf.getvalue()
+
+def as_upload(data, filename):
+    """FileStorage поверх SpooledTemporaryFile, как у загрузки через werkzeug"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode="rb+")
+    spooled.write(data)
+    spooled.seek(0)
+    return FileStorage(stream=spooled, filename=filename)
+
+def read_copy(file_storage):
+    return read_table(io.BytesIO(file_storage.read()), file_storage.filename, COLUMN_MAPPING.keys())
+
+def read_stream(file_storage):
+    return read_table(upload_stream(file_storage), file_storage.filename, COLUMN_MAPPING.keys())
+
+STRATEGIES = {"copy": read_copy, "stream": read_stream}
+
+def peak_mb(fn, data, filename):
+    upload = as_upload(data, filename)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        fn(upload)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+        upload.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 10000, 40000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    for fmt in args.formats:
+        for rows in args.rows:
+            data = encode(make_frame(rows), fmt)
+            filename = f"upload.{fmt}"
+            # Прогрев: импорты парсеров не должны попасть в замер
+            read_stream(as_upload(data, filename))
+            row = {"format": fmt, "rows": rows, "upload_mb": round(len(data) / 2**20, 2)}
+            for name, fn in STRATEGIES.items():
+                peak = peak_mb(fn, data, filename)
+                row[f"{name}_peak_mb"] = round(peak, 1)
+                row[f"{name}_per_upload_mb"] = round(peak / (len(data) / 2**20), 2)
+            results.append(row)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'format':<6} {'rows':>7} {'upload MB':>10} {'copy peak':>10} {'stream peak':>12} {'copy/MB':>8} {'stream/MB':>10}")
+    for r in results:
+        print(f"{r['format']:<6} {r['rows']:>7} {r['upload_mb']:>10.2f} {r['copy_peak_mb']:>10.1f} "
+              f"{r['stream_peak_mb']:>12.1f} {r['copy_per_upload_mb']:>8.2f} {r['stream_per_upload_mb']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
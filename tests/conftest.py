@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Кэши, очередь задач и выгрузки - во временном каталоге, настройки читаются при импорте api
+_TMP = tempfile.mkdtemp(prefix="kidski-tests-")
+os.environ.setdefault("KIDSKI_ARTIFACT_CACHE_DIR", os.path.join(_TMP, "artifacts"))
+os.environ.setdefault("KIDSKI_JOBS_DIR", os.path.join(_TMP, "jobs"))
+os.environ.setdefault("KIDSKI_BENCH_DATA", os.path.join(_TMP, "exports"))
+os.environ.setdefault("KIDSKI_WORKERS", "1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from synthetic import cached_export  # noqa: E402
+
+@pytest.fixture
+def export():
+    """Путь к синтетической выгрузке: export(rows, fmt="csv", wave="start", seed=0)"""
+    def make(rows, fmt="csv", wave="start", seed=0):
+        return cached_export(rows, fmt, wave, seed)
+    return make
+
+@pytest.fixture
+def client():
+    from api.index import app
+    return app.test_client()
+
+@pytest.fixture
+def store_db(tmp_path, monkeypatch):
+    """Хранилище результатов в отдельной базе на время теста"""
+    from api import store
+    monkeypatch.setattr(store, "STORE_DB", str(tmp_path / "results.db"))
+    monkeypatch.setattr(store, "_schema_ready", False)
+    return store
+
+def upload(path, name=None):
+    """Поле файла для test_client().post(..., content_type="multipart/form-data")"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return io.BytesIO(data), name or os.path.basename(path)
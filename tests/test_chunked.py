@@ -0,0 +1,43 @@
+import functools
+import io
+
+import pandas as pd
+from werkzeug.datastructures import FileStorage
+
+def _sheets(path):
+    from api import workbook
+    output = io.BytesIO()
+    with open(path, "rb") as f:
+        workbook.build_report(FileStorage(stream=f, filename="export.csv"), output)
+    return pd.read_excel(io.BytesIO(output.getvalue()), sheet_name=None)
+
+def test_upload_limit_leaves_room_for_chunked_mode():
+    from api.index import app
+    from api.utils import CHUNKED_MIN_BYTES
+    assert app.config["MAX_CONTENT_LENGTH"] > CHUNKED_MIN_BYTES
+
+def test_chunked_report_matches_whole_file(export, monkeypatch):
+    from api import utils, workbook
+    path = export(1000)
+    whole = _sheets(path)
+
+    # Как KIDSKI_CHUNKED_MB=0, куски по 300 строк - последний неполный
+    monkeypatch.setattr(workbook, "is_large_csv", functools.partial(utils.is_large_csv, min_bytes=0))
+    sizes = []
+
+    def iter_scored_chunks(file_storage):
+        for chunk in utils.iter_scored_chunks(file_storage, chunk_rows=300):
+            sizes.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(workbook, "iter_scored_chunks", iter_scored_chunks)
+    chunked = _sheets(path)
+    assert sizes == [300, 300, 300, 100]
+
+    assert list(chunked) == list(whole)
+    for name in whole:
+        expected, got = whole[name], chunked[name]
+        if name == "Возрасты":
+            # Возрасты с одинаковым числом детей могут идти в другом порядке
+            expected, got = (df.sort_values(list(df.columns)).reset_index(drop=True) for df in (expected, got))
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False, obj=name)
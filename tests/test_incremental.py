@@ -0,0 +1,78 @@
+import io
+
+import pandas as pd
+
+from conftest import upload
+
+def _post(client, path, name, **form):
+    form["file"] = upload(path, name)
+    res = client.post("/api/process", data=form, content_type="multipart/form-data")
+    assert res.status_code == 200, res.get_data(as_text=True)
+    return res, pd.read_excel(io.BytesIO(res.data), sheet_name=None)
+
+def _write(df, path):
+    df.to_csv(path, sep=";", index=False)
+    return str(path)
+
+def _check_summary(store, got, ref, source):
+    """Сводные листы - как у обычного отчета, итоги в totals - как пересчет по строкам"""
+    for sheet, frame in ref.items():
+        if sheet != "Полные_данные":
+            pd.testing.assert_frame_equal(got[sheet], frame)
+    from api.workbook import ReportTotals
+    wave = store.waves()[0]["wave"]
+    recount = ReportTotals()
+    recount.add(store.load_frame(wave, source=source))
+    agg = store.aggregates(wave, source)
+    assert agg["rows"] == recount.rows
+    assert agg["ages"] == recount.ages
+    assert {m: agg["levels"][m] for m in recount.levels} == recount.levels
+
+def test_growing_export(client, export, store_db, tmp_path):
+    full = pd.read_csv(export(600), sep=";", encoding="utf-8-sig", dtype=str)
+    path = tmp_path / "group.csv"
+    changed = full.copy()
+    changed.iloc[5, 10] = "7"
+    steps = [
+        (full.iloc[:500], 500, 0),
+        (full, 100, 0),
+        (changed, 1, 0),
+        (changed.drop(index=[3, 400]), 0, 2),
+        (full.drop(index=[3, 400]), 1, 0),
+    ]
+    for df, scored, deleted in steps:
+        _write(df, path)
+        res, got = _post(client, path, "group.csv", incremental="1")
+        assert (int(res.headers["X-Rows-Scored"]), int(res.headers["X-Rows-Deleted"])) == (scored, deleted)
+        _, ref = _post(client, path, "reference.csv")
+        _check_summary(store_db, got, ref, "group")
+        assert len(got["Полные_данные"]) == len(df)
+
+def test_first_run_matches_full_report(client, export, store_db):
+    path = export(400)
+    _, ref = _post(client, path, "ref.csv")
+    _, got = _post(client, path, "group.csv", incremental="1")
+    for sheet, frame in ref.items():
+        pd.testing.assert_frame_equal(got[sheet], frame)
+
+def test_full_and_incremental_saves_share_rows(client, export, store_db):
+    path = export(300)
+    _post(client, path, "group.csv", incremental="1")
+    _post(client, path, "group (2).csv")
+    res, _ = _post(client, path, "group.csv", incremental="1")
+    wave = res.headers["X-Stored-Wave"]
+    assert sum(row["Детей"] for row in store_db.summary(wave, by=())) == store_db.aggregates(wave)["rows"]
+    assert store_db.aggregates(wave)["rows"] == len(store_db.load_frame(wave))
+
+def test_key_repeated_across_chunks(client, export, store_db, tmp_path, monkeypatch):
+    from api import utils
+    monkeypatch.setattr(store_db, "iter_upload_frames", lambda f: utils.read_chunks(f, 100))
+    df = pd.read_csv(export(250), sep=";", encoding="utf-8-sig", dtype=str)
+    # Исправленный ответ в конце выгрузки: тот же ключ, что у строки из первого куска
+    fixed = df.iloc[[0]].copy()
+    fixed[df.columns[10]] = "3"
+    path = _write(pd.concat([df, fixed]), tmp_path / "group.csv")
+    res, got = _post(client, path, "group.csv", incremental="1")
+    unique = len(df.drop_duplicates(["ID", "Код ребёнка", "Время создания"]))
+    assert len(got["Полные_данные"]) == unique
+    assert store_db.aggregates(res.headers["X-Stored-Wave"], "group")["rows"] == unique
@@ -0,0 +1,36 @@
+import io
+
+import pandas as pd
+
+from conftest import upload
+
+def test_jobs_disabled_by_default(client):
+    # Без KIDSKI_JOBS=1 (как на Vercel) страница шлет синхронные запросы
+    assert "const JOBS_ENABLED = false;" in client.get("/").get_data(as_text=True)
+    assert client.post("/api/jobs", data={"kind": "process"}).status_code == 404
+    assert client.get("/api/jobs/unknown").status_code == 404
+
+def test_process_job(client, export, monkeypatch):
+    from api import jobs
+    monkeypatch.setattr(jobs, "ENABLED", True)
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 0)  # задачу выполняет сам тест
+    assert "const JOBS_ENABLED = true;" in client.get("/").get_data(as_text=True)
+
+    path = export(200)
+    res = client.post("/api/jobs", data={"kind": "process", "file": upload(path, "12-34.csv")},
+                      content_type="multipart/form-data")
+    assert res.status_code == 202
+    info = res.get_json()
+    assert info["status"] == jobs.QUEUED
+
+    row = jobs.claim()
+    assert row["id"] == info["id"]
+    jobs.run_job(row)
+    info = client.get(info["status_url"]).get_json()
+    assert info["status"] == jobs.DONE, info
+    got = client.get(info["download_url"])
+    assert got.headers["X-Filename"] == "12-34_results.xlsx"
+
+    sync = client.post("/api/process", data={"file": upload(path, "12-34.csv")}, content_type="multipart/form-data")
+    for sheet, frame in pd.read_excel(io.BytesIO(sync.data), sheet_name=None).items():
+        pd.testing.assert_frame_equal(pd.read_excel(io.BytesIO(got.data), sheet_name=sheet), frame)
@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.utils import (LAB_LIMITS, LEVELS, attention_index, attention_index_vec, calc_lab, calc_lab_vec,
+                       categorize_by_age, categorize_levels, clean_numeric, compact_frame, to_float)
+
+# Ячейки, как они приходят из выгрузок: десятичная запятая, пробелы, текст, пропуски
+NUMBERS = [0, 1, 2, 5, 6, 2.7, -1, -0.5, "0", "1", "3,0", " 2,5 ", "1 5", "4.9", "нет", "", None, np.nan,
+           math.inf, -math.inf, "inf", 1e9]
+REACHED = ["да", "нет", " Нет ", "НЕТ", "", None, np.nan, 1]
+AGES = ["2-3 года", "3-4 года", "5-6 лет", "6-7 (подготовительная)", "7-8 лет", "9 лет", "12", "1 год",
+        "старшая", "", None, np.nan]
+
+def _column(values):
+    return pd.Series(values, dtype=object)
+
+@pytest.mark.parametrize("limit", sorted(set(LAB_LIMITS.values())))
+def test_calc_lab_matches_scalar(limit):
+    rows = [(t, e, r) for t in NUMBERS + [limit, limit + 0.5, f"{limit},5"] for e in NUMBERS for r in REACHED]
+    times, errors, reached = (_column(values) for values in zip(*rows))
+    expected = [calc_lab(t, e, r, limit) for t, e, r in rows]
+    assert calc_lab_vec(times, errors, reached, limit).tolist() == expected
+
+def test_calc_lab_numeric_reached_column():
+    # Колонка «Дошел» без единого ответа читается как float
+    times, errors = _column([10, 100, 10]), _column([0, 0, 3])
+    reached = pd.Series([np.nan] * 3)
+    expected = [calc_lab(t, e, r, 35) for t, e, r in zip(times, errors, reached)]
+    assert calc_lab_vec(times, errors, reached, 35).tolist() == expected
+
+# inf - inf дает nan и в скалярной версии, NumPy об этом предупреждает
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+def test_attention_index_matches_scalar():
+    rows = [(r, e) for r in NUMBERS for e in NUMBERS]
+    rings, errors = (_column(values) for values in zip(*rows))
+    expected = np.array([attention_index(r, e) for r, e in rows], dtype=float)
+    np.testing.assert_array_equal(attention_index_vec(rings, errors), expected)
+
+def test_categorize_levels_matches_scalar():
+    values = [0, 0.1, 0.25, 0.3, 0.33, 0.45, 0.5, 0.55, 0.6, 0.66, 0.7, 0.8, 0.81, 1, -1, np.nan, math.inf]
+    rows = [(v, a) for v in values for a in AGES]
+    frame = pd.DataFrame({"a": [v for v, _ in rows], "b": [-v for v, _ in rows]})
+    ages = _column([a for _, a in rows])
+    got = categorize_levels(frame, ages)
+    for i, col in enumerate(frame.columns):
+        assert list(got[i]) == [categorize_by_age(v, a) for v, a in zip(frame[col], ages)]
+    assert list(got[0].categories) == LEVELS
+
+def test_categorize_levels_categorical_ages():
+    # Возраст в посчитанной таблице - категория (compact_frame)
+    ages = pd.Series(AGES * 2, dtype="category")
+    values = pd.DataFrame({"v": np.linspace(0, 1, len(ages))})
+    expected = [categorize_by_age(v, a) for v, a in zip(values["v"], ages)]
+    assert list(categorize_levels(values, ages)[0]) == expected
+
+def test_compact_frame_keeps_huge_integers_as_float():
+    # Случайное 1e20 в ячейке не должно превращаться в -2**63
+    df = compact_frame(pd.DataFrame({"small": [1.0, 2.0, 3.0], "huge": [1.0, 1e20, 3.0],
+                                     "edge": [0.0, 2.0 ** 53, -(2.0 ** 53)], "below": [0.0, 2.0 ** 53 - 1, 5.0]}))
+    assert df["small"].dtype == np.int8
+    assert df["huge"].dtype == np.float64 and df["huge"].tolist() == [1.0, 1e20, 3.0]
+    assert df["edge"].dtype == np.float64
+    assert df["below"].dtype == np.int64 and df["below"].iloc[1] == 2 ** 53 - 1
+
+def test_clean_numeric_matches_to_float():
+    cells = NUMBERS + ["да", "нет", "абв", "1,5", 7]
+    df = pd.DataFrame({"Л1": _column(cells), "Л2": _column(cells[::-1]), "И5-1Дошел": _column(cells)})
+    expected = {col: [to_float(v) for v in df[col]] for col in df.columns}
+    coerced = clean_numeric(df, list(df.columns))
+    for col, values in expected.items():
+        np.testing.assert_array_equal(df[col].to_numpy(dtype=float), values)
+    # Нераспознанный непустой текст считается, пропуски - нет; в «Дошел» да/нет - не ошибка
+    assert coerced == {"Л1": 4, "Л2": 4}
@@ -0,0 +1,71 @@
+from contextlib import closing
+
+import pandas as pd
+
+from conftest import upload
+
+WAVE = "2024-2025:start"
+
+def _process(client, path, name, **form):
+    form["file"] = upload(path, name)
+    res = client.post("/api/process", data=form, content_type="multipart/form-data")
+    assert res.status_code == 200, res.get_data(as_text=True)
+    return res
+
+def _children(store, wave=WAVE):
+    return sum(row["Детей"] for row in store.summary(wave, by=()))
+
+def test_reexports_do_not_double_count(client, export, store_db):
+    path = export(500, wave="start")
+    unique = len(pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str)
+                 .drop_duplicates(["ID", "Код ребёнка", "Время создания"]))
+    assert _process(client, path, "group.csv").headers["X-Stored-Wave"] == WAVE
+    # Та же выгрузка под другими именами и в другом формате - те же дети
+    _process(client, path, "group (2).csv")
+    _process(client, export(500, "xlsx", wave="start"), "group.xlsx")
+    assert _children(store_db) == unique
+
+def test_different_files_in_one_wave_are_both_stored(client, export, store_db):
+    _process(client, export(300, wave="start"), "a.csv")
+    _process(client, export(200, wave="end"), "b.csv", wave=WAVE)
+    assert _children(store_db) == 500
+    with closing(store_db._connect()) as conn:
+        files = {row[0] for row in conn.execute("SELECT filename FROM uploads")}
+    assert files == {"a.csv", "b.csv"}
+
+def _fresh_db(store, monkeypatch, path):
+    monkeypatch.setattr(store, "STORE_DB", str(path))
+    monkeypatch.setattr(store, "_schema_ready", False)
+
+def test_cached_report_is_still_stored(client, export, store_db, monkeypatch, tmp_path):
+    path = export(300, wave="start")
+    _process(client, path, "group.csv")
+
+    # Тот же файл в другую волну - отчет из кэша, строки в новой волне
+    res = _process(client, path, "group.csv", wave="2030-2031:end")
+    assert res.headers["X-Stored-Wave"] == "2030-2031:end"
+    assert _children(store_db, "2030-2031:end") == _children(store_db)
+
+    # Новая база за прогретым кэшем отчетов (и 304 по If-None-Match) тоже заполняется
+    _fresh_db(store_db, monkeypatch, tmp_path / "fresh.db")
+    res = client.post("/api/process", data={"file": upload(path, "group.csv")},
+                      headers={"If-None-Match": res.headers["ETag"]}, content_type="multipart/form-data")
+    assert res.status_code == 304 and res.headers["X-Stored-Wave"] == WAVE
+    assert _children(store_db) == 300
+
+def test_cached_comparison_is_still_stored(export, store_db, monkeypatch, tmp_path):
+    from api.compare import app
+    client = app.test_client()
+
+    def compare():
+        data = {"file_start": upload(export(200, wave="start"), "start.csv"),
+                "file_end": upload(export(200, wave="end"), "end.csv")}
+        res = client.post("/api/compare", data=data, content_type="multipart/form-data")
+        assert res.status_code == 200, res.get_data(as_text=True)
+
+    compare()
+    _fresh_db(store_db, monkeypatch, tmp_path / "fresh.db")
+    compare()
+    with closing(store_db._connect()) as conn:
+        waves = {row[0] for row in conn.execute("SELECT wave FROM uploads")}
+    assert waves == {WAVE, "2024-2025:end"}
@@ -0,0 +1,57 @@
+import io
+
+import pandas as pd
+from werkzeug.datastructures import FileStorage
+
+from conftest import upload
+
+def _report(client, path, name):
+    res = client.post("/api/process", data={"file": upload(path, name)}, content_type="multipart/form-data")
+    assert res.status_code == 200, res.get_data(as_text=True)
+    return res, pd.read_excel(io.BytesIO(res.data), sheet_name="Полные_данные")
+
+def test_different_uploads_get_their_own_results(client, export):
+    # Позиция потока после чтения не должна влиять на ключ кэша таблиц и отчетов
+    start, end = export(500, wave="start"), export(500, wave="end")
+    res_start, df_start = _report(client, start, "start.csv")
+    res_end, df_end = _report(client, end, "end.csv")
+    assert res_start.headers["ETag"] != res_end.headers["ETag"]
+    assert not df_start["Код"].equals(df_end["Код"])
+
+    expected = pd.read_csv(end, sep=";", encoding="utf-8-sig", dtype=str)
+    assert df_end["Код"].astype(str).tolist() == expected["Код ребёнка"].astype(str).str.strip().tolist()
+
+    # Повторная загрузка первого файла - снова его результаты (из кэша)
+    _, again = _report(client, start, "start.csv")
+    assert again.equals(df_start)
+
+def test_digest_ignores_stream_position(export):
+    from api.cache import file_digest
+    path = export(100)
+    with open(path, "rb") as f:
+        storage = FileStorage(stream=f, filename="a.csv")
+        at_start = file_digest(storage)
+        f.seek(0, 2)
+        assert file_digest(storage) == at_start
+        assert f.tell() == f.seek(0, 2)
+
+def test_xlsx_dates_are_written_as_dates(client, export):
+    # В синтетических выгрузках время - текст; настоящий xlsx хранит его датой
+    df = pd.read_csv(export(3), sep=";", encoding="utf-8-sig", dtype=str)
+    df["Время создания"] = pd.to_datetime(["2024-08-01 09:30:00", "2024-09-02 10:00:00", None])
+    data = io.BytesIO()
+    df.to_excel(data, index=False)
+    data.seek(0)
+    res = client.post("/api/process", data={"file": (data, "dates.xlsx")}, content_type="multipart/form-data")
+    assert res.status_code == 200, res.get_data(as_text=True)
+
+    report = pd.read_excel(io.BytesIO(res.data), sheet_name="Полные_данные")
+    assert report["Время"].tolist()[:2] == [pd.Timestamp("2024-08-01 09:30:00"), pd.Timestamp("2024-09-02 10:00:00")]
+    assert pd.isna(report["Время"].iloc[2])
+
+    from openpyxl import load_workbook
+    ws = load_workbook(io.BytesIO(res.data), read_only=True)["Полные_данные"]
+    column = [c.value for c in next(ws.iter_rows(max_row=1))].index("Время")
+    cells = [row[column] for row in ws.iter_rows(min_row=2)]
+    assert cells[0].is_date and cells[0].number_format == "yyyy-mm-dd hh:mm:ss"
+    assert cells[2].value is None